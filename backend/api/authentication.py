@@ -0,0 +1,79 @@
+"""
+Аутентификация по токену с кешированием пользователя.
+
+TokenAuthentication на каждый запрос выбирает из базы токен вместе
+с пользователем. Здесь по токену из общего кеша на TOKEN_CACHE_TIMEOUT
+секунд берутся id пользователя и флаги AUTH_FIELDS, остальные поля
+пользователя (и хеш пароля) в кеш не попадают. Запросы, меняющие данные,
+получают пользователя из базы целиком: сохранение экземпляра с
+отложенными полями загружало бы каждое поле отдельным запросом. Промах
+кеша не ждёт блокировки: неверный токен отклоняется сразу. Записи
+сбрасываются сигналами из api.signals после фиксации удаления токена
+(выход) и сохранения пользователя (смена пароля, деактивация).
+"""
+import hashlib
+
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram import cache
+from foodgram.constants import ERROR_USER_INACTIVE, TOKEN_CACHE_TIMEOUT
+from users.models import CustomUser
+
+AUTH_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser')
+
+
+def get_cache_key(token_key):
+    return cache.make_key(
+        'token', hashlib.sha256(token_key.encode()).hexdigest()
+    )
+
+
+def invalidate(token_keys):
+    cache.delete_many([get_cache_key(key) for key in token_keys])
+
+
+def get_user(values):
+    """Пользователь с полями из кеша, остальные поля отложены."""
+    fields = [
+        field.attname for field in CustomUser._meta.concrete_fields
+        if field.attname in values
+    ]
+    return CustomUser.from_db(
+        DEFAULT_DB_ALIAS, fields, [values[name] for name in fields]
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, запоминающая в кеше id и флаги пользователя."""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None or request.method in SAFE_METHODS:
+            return result
+        user, token = result
+        if user.get_deferred_fields():
+            user = CustomUser.objects.filter(pk=user.pk).first()
+            if user is None or not user.is_active:
+                raise AuthenticationFailed(ERROR_USER_INACTIVE)
+            token.user = user
+        return user, token
+
+    def authenticate_credentials(self, key):
+        cache_key = get_cache_key(key)
+        values = cache.get(cache_key)
+        if values is None:
+            user = super().authenticate_credentials(key)[0]
+            cache.set_many(
+                {cache_key: {
+                    name: getattr(user, name) for name in AUTH_FIELDS
+                }},
+                TOKEN_CACHE_TIMEOUT
+            )
+        else:
+            user = get_user(values)
+            if not user.is_active:
+                raise AuthenticationFailed(ERROR_USER_INACTIVE)
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,47 @@
+"""
+Условные GET-запросы (ETag, Last-Modified, If-None-Match).
+
+Версия ответа вычисляется до сериализации: для рецепта — по его
+updated_at и пользовательским флагам, для справочников тегов и
+ингредиентов — по общей версии каталога, которую сдвигают сигналы.
+"""
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from foodgram.cache import bump_version, get_version
+from foodgram.constants import CATALOG_VERSION
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION)
+
+
+def conditional_response(request, etag, last_modified, build, **cache_control):
+    """Отвечает 304, если версия у клиента актуальна, иначе вызывает build.
+
+    last_modified — время изменения в секундах или None.
+    """
+    etag = quote_etag(etag)
+    if last_modified is not None:
+        last_modified = int(last_modified)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, **cache_control)
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -1,6 +1,9 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from foodgram.constants import RECIPE_ORDERINGS
+from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
 from users.models import CustomUser
 
 
@@ -11,16 +14,37 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
     author = filters.ModelChoiceFilter(queryset=CustomUser.objects.all())
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ordering',
+        )
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=value
+        )))
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -34,12 +58,12 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_carts__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию, описанию и ингредиентам по релевантности."""
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
 
-class IngredientFilter(FilterSet):
-    """Фильтр для ингредиентов."""
-
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по оценкам из update_recipe_scores."""
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
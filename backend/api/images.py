@@ -0,0 +1,101 @@
+"""
+Уменьшенные копии загруженных изображений.
+
+После сохранения рецепта или аватара пул потоков строит для картинки
+варианты в формате WebP (см. IMAGE_VARIANTS). Имена вариантов выводятся
+из имени оригинала. Когда варианты построены, имя оригинала записывается
+в поле модели <поле>_variants_name, поэтому при выдаче ссылок хранилище
+не опрашивается.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from foodgram.constants import (
+    IMAGE_VARIANTS,
+    IMAGE_WEBP_QUALITY,
+    IMAGE_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS,
+    thread_name_prefix='image-variants'
+)
+pending = set()
+
+
+def get_variant_name(name, variant):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}_{variant}.webp')
+
+
+def get_variant_urls(file, built_name):
+    """Ссылки на варианты изображения, если они построены для file."""
+    if not file or file.name != built_name:
+        return {}
+    return {
+        variant: default_storage.url(get_variant_name(file.name, variant))
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def build_variants(name):
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image.draft('RGB', max(IMAGE_VARIANTS.values()))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB'
+            )
+        for variant, size in IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            buffer = BytesIO()
+            resized.save(buffer, 'WEBP', quality=IMAGE_WEBP_QUALITY)
+            variant_name = get_variant_name(name, variant)
+            default_storage.delete(variant_name)
+            default_storage.save(variant_name, ContentFile(buffer.getvalue()))
+
+
+def run(name, callback):
+    try:
+        build_variants(name)
+        if callback is not None:
+            callback()
+    except Exception:
+        logger.exception('Не удалось построить варианты %s', name)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(name, callback=None):
+    """Ставит построение вариантов в очередь после фиксации транзакции.
+
+    callback вызывается в рабочем потоке после построения вариантов.
+    """
+    transaction.on_commit(lambda: submit(name, callback))
+
+
+def submit(name, callback):
+    future = executor.submit(run, name, callback)
+    pending.add(future)
+    future.add_done_callback(pending.discard)
+
+
+def wait_variants(timeout=None):
+    """Дожидается построения уже поставленных в очередь вариантов."""
+    wait(list(pending), timeout)
+
+
+def delete_variants(name):
+    for variant in IMAGE_VARIANTS:
+        default_storage.delete(get_variant_name(name, variant))
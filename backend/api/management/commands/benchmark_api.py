@@ -0,0 +1,471 @@
+import json
+import math
+import time
+import tracemalloc
+from base64 import b64encode
+from collections import Counter
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.images import wait_variants
+from foodgram.constants import (
+    SYNTHETIC_USER_PASSWORD,
+    SYNTHETIC_USER_PREFIX,
+)
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга, values отсортированы."""
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+def summarize(samples):
+    latencies = sorted(sample['latency'] * 1000 for sample in samples)
+    queries = [sample['queries'] for sample in samples]
+    sizes = [sample['bytes'] for sample in samples]
+    return {
+        'requests': len(samples),
+        'statuses': dict(Counter(
+            str(sample['status']) for sample in samples
+        )),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        },
+        'bytes': {
+            'mean': round(sum(sizes) / len(sizes)),
+            'max': max(sizes),
+        },
+    }
+
+
+def summarize_memory(peaks):
+    """Пиковая память запросов по tracemalloc, пусто без замеров."""
+    if not peaks:
+        return {}
+    return {
+        'peak_memory_kb': {
+            'mean': round(sum(peaks) / len(peaks) / 1024),
+            'max': round(max(peaks) / 1024),
+        },
+    }
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new('RGB', (640, 480), (60, 120, 200)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогон всех эндпоинтов API через тестовый клиент: перцентили '
+        'задержки, число запросов к базе, размер ответа и пиковая память '
+        'загрузок изображений в JSON-отчёте'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--memory-iterations',
+            type=int,
+            default=3,
+            help='Отдельные прогоны загрузок с замером памяти (tracemalloc)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON-отчёта, по умолчанию вывод в консоль'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Предыдущий JSON-отчёт для сравнения'
+        )
+        parser.add_argument(
+            '--password',
+            default=SYNTHETIC_USER_PASSWORD,
+            help='Пароль пользователей (см. generate_data)'
+        )
+        parser.add_argument(
+            '--prefix',
+            default=SYNTHETIC_USER_PREFIX,
+            help='Префикс имён синтетических пользователей (см. generate_data)'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            self.prepare(options['password'], options['prefix'])
+            self.samples = None
+            self.memory = None
+            for _ in range(options['warmup']):
+                self.run_scenarios()
+            self.samples = {}
+            for _ in range(options['iterations']):
+                self.run_scenarios()
+            # tracemalloc замедляет выполнение, поэтому память меряется
+            # в отдельных прогонах, не влияющих на задержки.
+            samples, self.samples = self.samples, None
+            self.memory = {}
+            for _ in range(options['memory_iterations']):
+                self.write_recipe()
+                self.write_users()
+        finally:
+            self.finish()
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'iterations': options['iterations'],
+                'users': CustomUser.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'endpoints': {
+                name: {
+                    **summarize(endpoint_samples),
+                    **summarize_memory(self.memory.get(name)),
+                }
+                for name, endpoint_samples in samples.items()
+            },
+        }
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(content)
+        else:
+            self.stdout.write(content)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                self.compare(json.load(file), report)
+
+    def prepare(self, password, prefix=SYNTHETIC_USER_PREFIX):
+        """Выбирает читателя и автора среди синтетических пользователей.
+
+        Сценарии записи меняют избранное, подписки и рецепты читателя,
+        поэтому настоящие пользователи в прогоне не участвуют.
+        """
+        self.token = None
+        synthetic = CustomUser.objects.filter(username__startswith=prefix)
+        readers = synthetic.annotate(
+            total=Count('subscriber', distinct=True),
+            cart=Count('shopping_carts', distinct=True)
+        ).order_by('-total', 'pk')
+        self.reader = readers.filter(cart__gt=0).first() or readers.first()
+        if self.reader is None or not Recipe.objects.exists():
+            raise CommandError(
+                f'Нет пользователей с префиксом {prefix} или рецептов, '
+                'сначала выполните generate_data'
+            )
+        self.password = password
+        token, created = Token.objects.get_or_create(user=self.reader)
+        self.token = token if created else None
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.anonymous = APIClient()
+
+        self.author = synthetic.exclude(pk=self.reader.pk).exclude(
+            subscribed_to__user=self.reader
+        ).order_by('-recipes_count', 'pk').first()
+        if self.author is None:
+            raise CommandError(
+                'Нужен хотя бы ещё один синтетический пользователь'
+            )
+        self.recipe = Recipe.objects.exclude(
+            favorites__user=self.reader
+        ).exclude(
+            shopping_carts__user=self.reader
+        ).order_by('-favorites_count', 'pk').first()
+        self.tag = Tag.objects.order_by('pk').first()
+        self.tag_slugs = list(
+            Tag.objects.order_by('pk').values_list('slug', flat=True)[:2]
+        )
+        self.ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', 'name')[:2]
+        )
+        self.image = make_image()
+        pages = Recipe.objects.count() // settings.REST_FRAMEWORK['PAGE_SIZE']
+        self.deep_page = max(pages // 2, 1)
+
+    def finish(self):
+        """Удаляет токен читателя, если его создал прогон."""
+        if self.token is not None:
+            self.token.delete()
+
+    def request(
+        self, name, method, url, data=None, client=None, memory=False,
+        **extra
+    ):
+        """Выполняет запрос и записывает замеры под именем name.
+
+        memory=True отмечает загрузки, для которых в прогонах замера
+        памяти записывается пик выделенной памяти за запрос.
+        """
+        client = client or self.client
+        tracing = memory and self.memory is not None
+        if tracing:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'get':
+                response = client.get(url, data, **extra)
+            else:
+                response = getattr(client, method)(
+                    url, data, format='json', **extra
+                )
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+            latency = time.perf_counter() - started
+        if tracing:
+            self.memory.setdefault(name, []).append(
+                tracemalloc.get_traced_memory()[1]
+            )
+            tracemalloc.stop()
+        if self.samples is not None:
+            self.samples.setdefault(name, []).append({
+                'status': response.status_code,
+                'latency': latency,
+                'queries': len(queries),
+                'bytes': len(content),
+            })
+        return response
+
+    def run_scenarios(self):
+        self.read_catalog()
+        self.read_recipes()
+        self.read_users()
+        self.write_relations()
+        self.write_recipe()
+        self.write_users()
+
+    def read_catalog(self):
+        ingredient_id, ingredient_name = self.ingredients[0]
+        self.request('tags-list', 'get', '/api/tags/')
+        if self.tag is not None:
+            self.request('tags-detail', 'get', f'/api/tags/{self.tag.pk}/')
+        self.request('ingredients-list', 'get', '/api/ingredients/')
+        self.request(
+            'ingredients-search', 'get', '/api/ingredients/',
+            {'name': ingredient_name[:3]}
+        )
+        self.request(
+            'ingredients-search-fuzzy', 'get', '/api/ingredients/',
+            {'name': ingredient_name[:5], 'mode': 'fuzzy'}
+        )
+        self.request(
+            'ingredients-detail', 'get', f'/api/ingredients/{ingredient_id}/'
+        )
+
+    def read_recipes(self):
+        recipe_url = f'/api/recipes/{self.recipe.pk}/'
+        self.request('recipes-list', 'get', '/api/recipes/')
+        self.request(
+            'recipes-list-anonymous', 'get', '/api/recipes/',
+            client=self.anonymous
+        )
+        self.request(
+            'recipes-list-deep-page', 'get',
+            f'/api/recipes/?page={self.deep_page}'
+        )
+        self.request(
+            'recipes-list-cursor', 'get', '/api/recipes/?pagination=cursor'
+        )
+        self.request(
+            'recipes-list-popular', 'get', '/api/recipes/?ordering=popular'
+        )
+        self.request(
+            'recipes-list-trending-cursor', 'get',
+            '/api/recipes/?ordering=trending&pagination=cursor'
+        )
+        self.request(
+            'recipes-list-author', 'get',
+            f'/api/recipes/?author={self.author.pk}'
+        )
+        self.request(
+            'recipes-list-favorited', 'get', '/api/recipes/?is_favorited=1'
+        )
+        if self.tag is not None:
+            self.request(
+                'recipes-list-tags', 'get',
+                f'/api/recipes/?tags={self.tag.slug}'
+            )
+            self.request(
+                'recipes-list-tags-favorited', 'get', '/api/recipes/',
+                {'tags': self.tag_slugs, 'is_favorited': 1}
+            )
+        self.request('recipes-feed', 'get', '/api/recipes/feed/')
+        self.request(
+            'recipes-pantry', 'get', '/api/recipes/pantry/',
+            {'ingredients': [pk for pk, _ in self.ingredients]}
+        )
+        response = self.request('recipes-detail', 'get', recipe_url)
+        self.request(
+            'recipes-detail-not-modified', 'get', recipe_url,
+            HTTP_IF_NONE_MATCH=response.get('ETag', '')
+        )
+        self.request(
+            'recipes-detail-anonymous', 'get', recipe_url,
+            client=self.anonymous
+        )
+        self.request('recipes-get-link', 'get', f'{recipe_url}get-link/')
+        for renderer_format in ('pdf', 'txt', 'csv', 'json'):
+            self.request(
+                f'recipes-download-shopping-cart-{renderer_format}', 'get',
+                '/api/recipes/download_shopping_cart/'
+                f'?format={renderer_format}'
+            )
+
+    def read_users(self):
+        self.request('users-list', 'get', '/api/users/')
+        self.request(
+            'users-list-cursor', 'get', '/api/users/?pagination=cursor'
+        )
+        self.request('users-detail', 'get', f'/api/users/{self.author.pk}/')
+        self.request('users-me', 'get', '/api/users/me/')
+        self.request(
+            'users-subscriptions', 'get',
+            '/api/users/subscriptions/?recipes_limit=3'
+        )
+
+    def write_relations(self):
+        subscribe_url = f'/api/users/{self.author.pk}/subscribe/'
+        self.request('users-subscribe', 'post', subscribe_url)
+        self.request('users-unsubscribe', 'delete', subscribe_url)
+        for action in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{self.recipe.pk}/{action}/'
+            self.request(f'recipes-{action}-add', 'post', url)
+            self.request(f'recipes-{action}-delete', 'delete', url)
+
+    def write_recipe(self):
+        data = {
+            'name': 'Тестовый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [self.tag.pk] if self.tag is not None else [],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 100}
+                for ingredient_id, _ in self.ingredients
+            ],
+        }
+        response = self.request(
+            'recipes-create', 'post', '/api/recipes/', data, memory=True
+        )
+        if response.status_code != 201:
+            return
+        # Варианты изображения строятся в фоне и пишут в базу: SQLite
+        # не выдерживает параллельной записи из потока и запроса.
+        wait_variants()
+        url = f'/api/recipes/{response.json()["id"]}/'
+        data.pop('image')
+        data['cooking_time'] = 20
+        self.request('recipes-partial-update', 'patch', url, data)
+        self.request('recipes-destroy', 'delete', url)
+
+    def write_users(self):
+        """Сценарии учётной записи на пользователе, созданном прогоном."""
+        number = time.monotonic_ns()
+        email = f'benchmark{number}@example.com'
+        response = self.request('users-create', 'post', '/api/users/', {
+            'email': email,
+            'username': f'benchmark{number}',
+            'first_name': 'Бенчмарк',
+            'last_name': 'Бенчмарков',
+            'password': self.password,
+        }, client=self.anonymous)
+        if response.status_code != 201:
+            return
+        try:
+            self.write_own_user(email)
+        finally:
+            CustomUser.objects.filter(pk=response.json()['id']).delete()
+
+    def write_own_user(self, email):
+        response = self.request(
+            'auth-token-login', 'post', '/api/auth/token/login/',
+            {'email': email, 'password': self.password},
+            client=self.anonymous
+        )
+        if response.status_code != 200:
+            return
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}'
+        )
+        self.request(
+            'users-me-avatar-put', 'put', '/api/users/me/avatar/',
+            {'avatar': self.image}, client=client, memory=True
+        )
+        wait_variants()
+        self.request(
+            'users-me-avatar-delete', 'delete', '/api/users/me/avatar/',
+            client=client
+        )
+        self.request(
+            'users-set-password', 'post', '/api/users/set_password/',
+            {
+                'current_password': self.password,
+                'new_password': self.password,
+            },
+            client=client
+        )
+        self.request(
+            'auth-token-logout', 'post', '/api/auth/token/logout/',
+            client=client
+        )
+
+    def compare(self, baseline, report):
+        self.stdout.write(
+            f'{"эндпоинт":<40} {"p50, мс":>20} {"запросов":>14}'
+        )
+        for name, current in report['endpoints'].items():
+            previous = baseline['endpoints'].get(name)
+            if previous is None:
+                continue
+            old = previous['latency_ms']['p50']
+            new = current['latency_ms']['p50']
+            change = (new - old) / old * 100 if old else 0
+            line = (
+                f'{name:<40} {old:>7.2f} → {new:>7.2f} {change:+5.0f}% '
+                f'{previous["queries"]["mean"]:>6} → '
+                f'{current["queries"]["mean"]:<6}'
+            )
+            if change > 20:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+        for name, current in report['endpoints'].items():
+            previous = baseline['endpoints'].get(name, {})
+            if 'peak_memory_kb' in current and 'peak_memory_kb' in previous:
+                self.stdout.write(
+                    f'{name:<40} пик памяти, КБ: '
+                    f'{previous["peak_memory_kb"]["max"]} → '
+                    f'{current["peak_memory_kb"]["max"]}'
+                )
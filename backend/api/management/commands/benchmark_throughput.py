@@ -0,0 +1,140 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.benchmark_api import percentile
+from recipes.models import Recipe
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон эндпоинтов чтения на запущенном сервере: '
+        'пропускная способность и задержки при заданной конкурентности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Адрес сервера (gunicorn с SERVER_PROFILE=wsgi или asgi)'
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Число запросов на каждый эндпоинт'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON-отчёта, по умолчанию вывод в консоль'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Предыдущий JSON-отчёт для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        self.base_url = options['url'].rstrip('/')
+        self.token = self.get_token()
+        report = {
+            'meta': {
+                'url': self.base_url,
+                'concurrency': options['concurrency'],
+            },
+            'endpoints': {},
+        }
+        for name, path, authenticated in self.get_endpoints():
+            self.fetch(path, authenticated)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                results = list(executor.map(
+                    lambda _: self.fetch(path, authenticated),
+                    range(options['requests'])
+                ))
+            elapsed = time.perf_counter() - started
+            latencies = sorted(latency * 1000 for _, latency in results)
+            report['endpoints'][name] = {
+                'rps': round(len(results) / elapsed, 1),
+                'errors': sum(status >= 400 for status, _ in results),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+            }
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(content)
+        else:
+            self.stdout.write(content)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                self.compare(json.load(file), report)
+
+    def get_token(self):
+        reader = CustomUser.objects.annotate(
+            total=Count('subscriber')
+        ).order_by('-total', 'pk').first()
+        if reader is None or not Recipe.objects.exists():
+            raise CommandError(
+                'Нет данных для прогона, сначала выполните generate_data'
+            )
+        token, _ = Token.objects.get_or_create(user=reader)
+        return token.key
+
+    def get_endpoints(self):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        return [
+            ('tags-list', '/api/tags/', False),
+            (
+                'ingredients-list',
+                '/api/ingredients/?' + urlencode({'name': 'к'}),
+                False
+            ),
+            ('recipes-list', '/api/recipes/', True),
+            ('recipes-list-anonymous', '/api/recipes/', False),
+            ('recipes-detail', f'/api/recipes/{recipe.pk}/', True),
+            (
+                'users-subscriptions',
+                '/api/users/subscriptions/?recipes_limit=3',
+                True
+            ),
+        ]
+
+    def fetch(self, path, authenticated):
+        request = Request(self.base_url + path)
+        if authenticated:
+            request.add_header('Authorization', f'Token {self.token}')
+        started = time.perf_counter()
+        try:
+            with urlopen(request) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        return status, time.perf_counter() - started
+
+    def compare(self, baseline, report):
+        self.stdout.write(
+            f'{"эндпоинт":<28} {"запросов/с":>22} {"p50, мс":>20}'
+        )
+        for name, current in report['endpoints'].items():
+            previous = baseline['endpoints'].get(name)
+            if previous is None:
+                continue
+            change = (
+                current['rps'] / previous['rps'] * 100 - 100
+                if previous['rps'] else 0
+            )
+            self.stdout.write(
+                f'{name:<28} {previous["rps"]:>7} → {current["rps"]:>7} '
+                f'{change:+5.0f}% {previous["p50_ms"]:>8} → '
+                f'{current["p50_ms"]:<8}'
+            )
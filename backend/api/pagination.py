@@ -1,7 +1,276 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram.constants import ERROR_INVALID_CURSOR, RECIPE_ORDERINGS
+from recipes.feed import get_feed_sources
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса, без его выполнения.
+
+    Доступна только для PostgreSQL, для других СУБД возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки (keyset).
+
+    Следующая страница выбирается условием WHERE по значениям полей
+    ordering последней строки, поэтому глубокие страницы обходятся так же
+    дёшево, как первая. Поле count заполняется оценкой из плана запроса,
+    если передан параметр count=estimate.
+    """
+
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def encode_cursor(self, obj, reverse):
+        values = [
+            self.fields[name].value_to_string(obj)
+            for name in self.field_names
+        ]
+        return b64encode(
+            json.dumps([reverse, *values]).encode()
+        ).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return False, None
+        try:
+            reverse, *values = json.loads(b64decode(cursor.encode()))
+            if len(values) != len(self.field_names):
+                raise ValueError
+            values = [
+                self.to_python(name, value)
+                for name, value in zip(self.field_names, values)
+            ]
+        except (
+            BinasciiError, DjangoValidationError, TypeError, ValueError
+        ):
+            raise NotFound(ERROR_INVALID_CURSOR)
+        return bool(reverse), values
+
+    def to_python(self, name, value):
+        """Значение поля из курсора; null и вложенные значения отвергаются."""
+        if isinstance(value, bool) or not isinstance(value, (str, int)):
+            raise ValueError
+        value = self.fields[name].to_python(value)
+        if value is None:
+            raise ValueError
+        return value
+
+    def get_position_filter(self, values, reverse, names=None):
+        """Условие «строго после позиции values» в порядке выдачи.
+
+        names заменяет имена полей ordering, если условие строится
+        для другой модели с теми же значениями ключа.
+        """
+        condition = Q()
+        equal = Q()
+        bound = None
+        for field, name, value in zip(
+            self.ordering, names or self.field_names, values
+        ):
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+            if bound is None:
+                bound = Q(**{f'{name}__{lookup}e': value})
+        # Избыточная граница по первому полю позволяет СУБД читать
+        # составной индекс диапазоном, а не перебирать ветви OR.
+        return bound & condition
+
+    def get_ordering(self, reverse, names=None):
+        return [
+            ('-' if field.startswith('-') != reverse else '') + name
+            for field, name in zip(self.ordering, names or self.field_names)
+        ]
+
+    def get_rows(self, queryset, values, reverse, limit):
+        """Первые limit строк после позиции values в порядке выдачи."""
+        if values is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(values, reverse)
+            )
+        return list(queryset.order_by(*self.get_ordering(reverse))[:limit])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        self.field_names = [field.lstrip('-') for field in self.ordering]
+        self.fields = {
+            name: queryset.model._meta.get_field(name)
+            for name in self.field_names
+        }
+        reverse, values = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count = estimate_count(queryset)
+
+        results = self.get_rows(queryset, values, reverse, page_size + 1)
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = results
+        return results
+
+    def get_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(obj, reverse)
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    """Курсорная пагинация ленты рецептов.
+
+    Параметр ordering выбирает ключ из RECIPE_ORDERINGS, по умолчанию
+    рецепты идут от новых к старым.
+    """
+
+    ordering = ('-pub_date', '-id')
+    ordering_query_param = 'ordering'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = RECIPE_ORDERINGS.get(
+            request.query_params.get(self.ordering_query_param),
+            type(self).ordering
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class FeedPagination(RecipeKeysetPagination):
+    """Курсорная пагинация ленты подписок.
+
+    Страница сливается из материализованной ленты пользователя и рецептов
+    популярных авторов: из каждого источника берётся не больше страницы
+    по ключу (pub_date, id), затем рецепты выбираются из queryset.
+    Поле count не заполняется.
+    """
+
+    count_query_param = None
+    ordering_query_param = None
+    item_field_names = ('pub_date', 'recipe_id')
+
+    def get_rows(self, queryset, values, reverse, limit):
+        sources = []
+        for source, names in zip(
+            get_feed_sources(self.request.user),
+            (self.item_field_names, self.field_names)
+        ):
+            if values is not None:
+                source = source.filter(
+                    self.get_position_filter(values, reverse, names)
+                )
+            sources.extend(source.order_by(
+                *self.get_ordering(reverse, names)
+            ).values_list(*names)[:limit])
+        keys = sorted(sources, reverse=not reverse)[:limit]
+        recipes = queryset.in_bulk([recipe_id for _, recipe_id in keys])
+        return [
+            recipes[recipe_id] for _, recipe_id in keys
+            if recipe_id in recipes
+        ]
+
+
+class UserKeysetPagination(KeysetPagination):
+    """Курсорная пагинация списков пользователей."""
+
+    ordering = ('username', 'id')
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     """Кастомная пагинация."""
 
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    keyset_pagination_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_paginator = None
+        if (
+            self.keyset_pagination_class is not None
+            and request.query_params.get(self.mode_query_param) == 'cursor'
+        ):
+            self.keyset_paginator = self.keyset_pagination_class()
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CustomPageNumberPagination):
+    """Пагинация рецептов, pagination=cursor включает курсорный режим."""
+
+    keyset_pagination_class = RecipeKeysetPagination
+
+
+class UserPagination(CustomPageNumberPagination):
+    """Пагинация пользователей, pagination=cursor включает курсорный режим."""
+
+    keyset_pagination_class = UserKeysetPagination
@@ -0,0 +1,228 @@
+"""
+Профилирование запросов к API.
+
+ProfilingMiddleware считает для каждого запроса число SQL-запросов,
+повторяющиеся запросы (признак N+1), время в базе данных, во вьюхе,
+на рендеринг ответа и общее время. Замеры уходят в заголовок
+Server-Timing и копятся в статистике процесса по вьюсетам и действиям.
+Медленные запросы пишутся в лог, а выборочно профилируемые cProfile
+сохраняются в REQUEST_PROFILING_DIR.
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def fingerprint(sql):
+    """Текст запроса без значений и без длины списков в IN (...)."""
+    return PLACEHOLDERS.sub('%s', LITERALS.sub('%s', sql))
+
+
+def simulate_latency(execute, sql, params, many, context):
+    time.sleep(settings.DB_SIMULATED_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+def add_simulated_latency(connection, **kwargs):
+    """Задержка DB_SIMULATED_LATENCY_MS перед каждым SQL-запросом.
+
+    Имитирует удалённую базу данных в нагрузочных прогонах.
+    """
+    if simulate_latency not in connection.execute_wrappers:
+        connection.execute_wrappers.append(simulate_latency)
+
+
+class RequestProfile:
+    """Замеры одного запроса, заодно обёртка выполнения SQL."""
+
+    def __init__(self):
+        self.key = None
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.marks = {'start': (time.perf_counter(), 0.0)}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[fingerprint(sql)] += 1
+
+    def mark(self, name):
+        self.marks.setdefault(name, (time.perf_counter(), self.db_time))
+
+    def span(self, start, end):
+        """Время между отметками без учёта базы данных, в секундах."""
+        if start not in self.marks or end not in self.marks:
+            return None
+        (started, db_started), (finished, db_finished) = (
+            self.marks[start], self.marks[end]
+        )
+        return finished - started - (db_finished - db_started)
+
+    @property
+    def total(self):
+        return self.marks['finish'][0] - self.marks['start'][0]
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.queries.items() if count > 1}
+
+    def server_timing(self):
+        metrics = [
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.query_count} '
+            f'queries, {len(self.duplicates)} duplicated"'
+        ]
+        view = self.span('view', 'view_finished')
+        if view is None:
+            view = self.span('view', 'finish')
+        render = self.span('view_finished', 'rendered')
+        for name, duration in (('view', view), ('render', render)):
+            if duration is not None:
+                metrics.append(f'{name};dur={duration * 1000:.2f}')
+        metrics.append(f'total;dur={self.total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+class RequestStats:
+    """Накопленная статистика процесса по вьюсетам и действиям."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, profile):
+        with self.lock:
+            item = self.views.setdefault(profile.key, {
+                'requests': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'db': 0.0,
+                'queries': 0,
+                'duplicates': Counter(),
+            })
+            item['requests'] += 1
+            item['total'] += profile.total
+            item['max'] = max(item['max'], profile.total)
+            item['db'] += profile.db_time
+            item['queries'] += profile.query_count
+            item['duplicates'].update(profile.duplicates)
+
+    def snapshot(self):
+        with self.lock:
+            items = sorted(
+                self.views.items(),
+                key=lambda pair: pair[1]['total'],
+                reverse=True
+            )
+            return {key: self.summarize(item) for key, item in items}
+
+    @staticmethod
+    def summarize(item):
+        requests = item['requests']
+        return {
+            'requests': requests,
+            'mean_ms': round(item['total'] / requests * 1000, 2),
+            'max_ms': round(item['max'] * 1000, 2),
+            'mean_db_ms': round(item['db'] / requests * 1000, 2),
+            'mean_queries': round(item['queries'] / requests, 2),
+            'duplicates': [
+                {'sql': sql, 'count': count}
+                for sql, count in item['duplicates'].most_common(5)
+            ],
+        }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+stats = RequestStats()
+
+
+class ProfilingMiddleware:
+    """Включается настройкой REQUEST_PROFILING."""
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = request.profile = RequestProfile()
+        profiler = None
+        if random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        profile.mark('finish')
+
+        response['Server-Timing'] = profile.server_timing()
+        if profile.key is not None:
+            stats.record(profile)
+        if profile.total * 1000 >= settings.REQUEST_PROFILING_SLOW_MS:
+            self.report_slow(request, profile, profiler)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None) or {}
+        view_class = getattr(view_func, 'cls', None)
+        name = view_class.__name__ if view_class else view_func.__name__
+        request.profile.key = f'{name}.{actions.get(method, method)}'
+        request.profile.mark('view')
+
+    def process_template_response(self, request, response):
+        request.profile.mark('view_finished')
+        response.add_post_render_callback(
+            lambda response: request.profile.mark('rendered')
+        )
+        return response
+
+    def report_slow(self, request, profile, profiler):
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.0f мс, SQL: %d за %.0f мс, '
+            'повторяющихся: %d',
+            request.method,
+            request.get_full_path(),
+            profile.key,
+            profile.total * 1000,
+            profile.query_count,
+            profile.db_time * 1000,
+            len(profile.duplicates)
+        )
+        if profiler is None:
+            return
+        os.makedirs(settings.REQUEST_PROFILING_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(
+            settings.REQUEST_PROFILING_DIR,
+            f'{profile.key}-{time.time_ns()}.prof'
+        ))
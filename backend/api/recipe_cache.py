@@ -0,0 +1,57 @@
+"""
+Кеш представлений рецептов.
+
+В кеше хранится часть ответа RecipeSerializer, не зависящая от
+пользователя и запроса: ссылки на файлы относительные, флаги
+is_favorited, is_in_shopping_cart и is_subscribed подставляются при
+каждом ответе. Записи сбрасываются сигналами из api.signals.
+"""
+from django.utils import timezone
+
+from foodgram import cache
+from foodgram.constants import RECIPE_CACHE_TIMEOUT
+from recipes.models import Recipe
+
+
+def get_cache_key(recipe_id):
+    return cache.make_key('recipe', recipe_id)
+
+
+def get_many(recipes, build):
+    """Возвращает словарь {id: представление} для рецептов.
+
+    Отсутствующие в кеше представления строит build(recipes) одним
+    вызовом и сохраняет в кеш.
+    """
+    keys = {recipe.id: get_cache_key(recipe.id) for recipe in recipes}
+    cached = cache.get_many(keys.values())
+    result = {}
+    missing = []
+    for recipe in recipes:
+        data = cached.get(keys[recipe.id])
+        if data is None:
+            missing.append(recipe)
+        else:
+            result[recipe.id] = data
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {keys[recipe_id]: data for recipe_id, data in built.items()},
+            RECIPE_CACHE_TIMEOUT
+        )
+        result.update(built)
+    return result
+
+
+def invalidate(recipe_ids):
+    cache.delete_many([get_cache_key(recipe_id) for recipe_id in recipe_ids])
+
+
+def touch(recipe_ids):
+    """Отмечает рецепты изменёнными: сдвигает их updated_at.
+
+    Нужна, когда представление рецепта меняется без сохранения самого
+    рецепта, например при переименовании тега или автора. Кеш сбрасывает
+    вызывающий код после фиксации транзакции.
+    """
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
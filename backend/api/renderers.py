@@ -0,0 +1,39 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Файл формирует экспортёр из api.shopping_list, рендерер нужен для
+    выбора формата по ?format= или заголовку Accept. Ошибки выводятся
+    в JSON независимо от выбранного формата (см. handle_exception
+    RecipeViewSet).
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class PDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
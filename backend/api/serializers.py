@@ -1,11 +1,27 @@
 import base64
+import binascii
 import re
-
-from django.core.files.base import ContentFile
+import weakref
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile,
+)
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from PIL import Image
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
+from api import recipe_cache
+from api.images import get_variant_urls
 from foodgram.constants import (
+    ERROR_IMAGE_INVALID,
+    ERROR_IMAGE_TOO_LARGE,
     ERROR_INGREDIENT_AMOUNT,
     ERROR_INGREDIENTS_DUPLICATE,
     ERROR_INGREDIENTS_NOT_EXIST,
@@ -14,6 +30,9 @@ from foodgram.constants import (
     ERROR_TAGS_REQUIRED,
     ERROR_USERNAME_INVALID,
     ERROR_USERNAME_ME,
+    IMAGE_DECODE_CHUNK_SIZE,
+    IMAGE_MAX_SIDE,
+    IMAGE_MAX_UPLOAD_SIZE,
 )
 from recipes.models import (
     Favorite,
@@ -22,37 +41,160 @@ from recipes.models import (
     RecipeIngredient,
     ShoppingCart,
     Tag,
+    get_recipe_related_lookups,
 )
 from users.models import CustomUser, Subscription
 
 
+def close_quietly(file):
+    try:
+        file.close()
+    except FileNotFoundError:
+        pass
+
+
 class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для обработки изображений в base64."""
+    """Кастомное поле для обработки изображений в base64.
+
+    Строка декодируется по частям во временный файл: небольшие картинки
+    остаются в памяти, крупные сразу пишутся на диск. Размеры проверяются
+    по заголовку до полной проверки изображения Pillow.
+    """
+
+    def decode(self, data):
+        try:
+            format, imgstr = data.split(';base64,')
+        except ValueError:
+            raise serializers.ValidationError(ERROR_IMAGE_INVALID)
+        ext = format.split('/')[-1]
+        size = len(imgstr) * 3 // 4
+        if size > IMAGE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(ERROR_IMAGE_TOO_LARGE)
+
+        name = 'temp.' + ext
+        content_type = format[len('data:'):]
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, size, None)
+            # Хранилище может переместить временный файл при сохранении,
+            # поэтому закрываем его без ошибки, когда поле больше не нужно.
+            weakref.finalize(file, close_quietly, file.file)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None
+            )
+        try:
+            for start in range(0, len(imgstr), IMAGE_DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    imgstr[start:start + IMAGE_DECODE_CHUNK_SIZE]
+                ))
+        except binascii.Error:
+            file.close()
+            raise serializers.ValidationError(ERROR_IMAGE_INVALID)
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def check_dimensions(self, file):
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            raise serializers.ValidationError(ERROR_IMAGE_TOO_LARGE)
+        except Exception:
+            # Повреждённое изображение отклонит проверка Pillow в ImageField.
+            return
+        finally:
+            file.seek(0)
+        if max(width, height) > IMAGE_MAX_SIDE:
+            raise serializers.ValidationError(ERROR_IMAGE_TOO_LARGE)
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
+        if hasattr(data, 'seek'):
+            self.check_dimensions(data)
         return super().to_internal_value(data)
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения в формате WebP.
+
+    Источник — объект целиком: кроме файла нужно поле
+    <image_field>_variants_name с именем, для которого построены копии.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, value):
+        urls = get_variant_urls(
+            getattr(value, self.image_field),
+            getattr(value, f'{self.image_field}_variants_name')
+        )
+        request = self.context.get('request')
+        if request is not None:
+            urls = {
+                variant: request.build_absolute_uri(url)
+                for variant, url in urls.items()
+            }
+        return urls
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, разрешаемый одним запросом к базе."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pks = []
+        for pk in data:
+            try:
+                pks.append(queryset.model._meta.pk.to_python(pk))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, при many=True читающий объекты разом."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
 class CustomUserSerializer(UserSerializer):
     """Сериализатор пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = CustomUser
         fields = (
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'avatar'
+            'last_name', 'is_subscribed', 'avatar', 'avatar_variants'
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        return (
+        return bool(
             request
             and request.user.is_authenticated
             and Subscription.objects.filter(
@@ -133,8 +275,20 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов, читающий кеш одним обращением."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representations(list(recipes))
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор рецептов для чтения."""
+    """Сериализатор рецептов для чтения.
+
+    Общая для всех пользователей часть ответа берётся из кеша
+    представлений, пользовательские флаги добавляются поверх неё.
+    """
 
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
@@ -146,41 +300,102 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants',
+            'text', 'cooking_time'
         )
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
+    def _get_user_flag(self, obj, name, queryset):
+        if hasattr(obj, name):
+            return getattr(obj, name)
         request = self.context.get('request')
-        return (
+        return bool(
             request
             and request.user.is_authenticated
-            and Favorite.objects.filter(
-                user=request.user,
-                recipe=obj
-            ).exists()
+            and queryset.filter(user=request.user).exists()
+        )
+
+    def get_is_favorited(self, obj):
+        return self._get_user_flag(
+            obj, 'is_favorited', Favorite.objects.filter(recipe=obj)
         )
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and ShoppingCart.objects.filter(
-                user=request.user,
-                recipe=obj
-            ).exists()
+        return self._get_user_flag(
+            obj,
+            'is_in_shopping_cart',
+            ShoppingCart.objects.filter(recipe=obj)
         )
 
+    def get_is_subscribed_to_author(self, obj):
+        return self._get_user_flag(
+            obj,
+            'is_subscribed_to_author',
+            Subscription.objects.filter(author_id=obj.author_id)
+        )
+
+    def build_representations(self, recipes):
+        prefetch_related_objects(recipes, *get_recipe_related_lookups())
+        serializer = RecipeSerializer(context={})
+        return {
+            recipe.id: super(RecipeSerializer, serializer).to_representation(
+                recipe
+            )
+            for recipe in recipes
+        }
+
+    def to_representations(self, recipes):
+        cached = recipe_cache.get_many(recipes, self.build_representations)
+        request = self.context.get('request')
+        result = []
+        for recipe in recipes:
+            data = dict(cached[recipe.id])
+            author = data['author'] = dict(data['author'])
+            data['is_favorited'] = self.get_is_favorited(recipe)
+            data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+            author['is_subscribed'] = self.get_is_subscribed_to_author(recipe)
+            if request is not None:
+                self.build_absolute_urls(request, data, author)
+            result.append(data)
+        return result
+
+    def to_representation(self, instance):
+        return self.to_representations([instance])[0]
+
+    @staticmethod
+    def build_absolute_urls(request, data, author):
+        for item, field in ((data, 'image'), (author, 'avatar')):
+            if item[field]:
+                item[field] = request.build_absolute_uri(item[field])
+            variants = item[f'{field}_variants'] = dict(
+                item[f'{field}_variants']
+            )
+            for variant, url in variants.items():
+                variants[variant] = request.build_absolute_uri(url)
+
+
+class PantryRecipeSerializer(RecipeSerializer):
+    """Рецепт в подборе по продуктам: сколько ингредиентов недостаёт."""
+
+    def to_representations(self, recipes):
+        result = super().to_representations(recipes)
+        for data, recipe in zip(result, recipes):
+            data['missing_ingredients_count'] = recipe.missing_count
+            total = recipe.found_count + recipe.missing_count
+            data['coverage'] = round(recipe.found_count / total, 3)
+        return result
+
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания и обновления рецептов."""
 
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -247,17 +462,17 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user,
-            **validated_data
-        )
+        author = self.context['request'].user
+        recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
@@ -281,10 +496,11 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Краткий сериализатор рецепта."""
     image = Base64ImageField()
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionSerializer(CustomUserSerializer):
@@ -299,6 +515,8 @@ class SubscriptionSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'recipes_page'):
+            return RecipeShortSerializer(obj.recipes_page, many=True).data
         request = self.context.get('request')
         recipes_limit = request.query_params.get('recipes_limit')
         recipes = obj.recipes.all()
@@ -310,4 +528,4 @@ class SubscriptionSerializer(CustomUserSerializer):
         return RecipeShortSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
@@ -0,0 +1,150 @@
+"""
+Формирование списка покупок.
+
+Каждый формат выгрузки регистрируется в EXPORTERS. Готовый файл
+кешируется для каждого пользователя и формата под версией его списка.
+Сигналы после фиксации транзакции меняют версию, когда меняется корзина
+или состав рецептов в ней: файл, собранный по старой корзине во время
+транзакции, остаётся под прежней версией и больше не читается.
+"""
+import csv
+import json
+from io import BytesIO, StringIO
+
+from django.db.models import Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from foodgram import cache
+from foodgram.constants import SHOPPING_LIST_CACHE_TIMEOUT
+from recipes.models import RecipeIngredient, ShoppingCart
+
+CHUNK_SIZE = 8192
+
+EXPORTERS = {}
+
+
+def exporter(format):
+    """Регистрирует функцию выгрузки списка покупок в формате format."""
+    def decorator(func):
+        EXPORTERS[format] = func
+        return func
+    return decorator
+
+
+def get_version_name(user_id):
+    return f'shopping_list:{user_id}'
+
+
+def get_cache_key(user_id, format):
+    return cache.make_key(
+        'shopping_list',
+        user_id,
+        cache.get_version(get_version_name(user_id)),
+        format
+    )
+
+
+def get_ingredients(user):
+    """Суммирует ингредиенты всех рецептов из корзины пользователя."""
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_carts__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def get_lines(ingredients):
+    for ingredient in ingredients:
+        name = ingredient['ingredient__name']
+        unit = ingredient['ingredient__measurement_unit']
+        amount = ingredient['total_amount']
+        yield f"{name} ({unit}) - {amount}"
+
+
+@exporter('pdf')
+def render_pdf(ingredients):
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+
+    p.setFont('Helvetica', 14)
+    p.drawString(100, 800, 'Shopping List')
+
+    y = 750
+    for text in get_lines(ingredients):
+        p.drawString(100, y, text)
+        y -= 20
+        if y < 50:
+            p.showPage()
+            p.setFont('Helvetica', 14)
+            y = 800
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+@exporter('txt')
+def render_txt(ingredients):
+    return ''.join(
+        f'{line}\n' for line in get_lines(ingredients)
+    ).encode('utf-8')
+
+
+@exporter('csv')
+def render_csv(ingredients):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    writer.writerows(
+        (
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount'],
+        )
+        for ingredient in ingredients
+    )
+    return buffer.getvalue().encode('utf-8')
+
+
+@exporter('json')
+def render_json(ingredients):
+    return json.dumps(
+        [
+            {
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['total_amount'],
+            }
+            for ingredient in ingredients
+        ],
+        ensure_ascii=False,
+    ).encode('utf-8')
+
+
+def get_shopping_list(user, format):
+    """Возвращает список покупок в формате format, по возможности из кеша."""
+    return cache.get_or_set(
+        get_cache_key(user.id, format),
+        lambda: EXPORTERS[format](get_ingredients(user)),
+        SHOPPING_LIST_CACHE_TIMEOUT
+    )
+
+
+def iter_chunks(content):
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield content[start:start + CHUNK_SIZE]
+
+
+def invalidate(user_ids):
+    cache.bump_versions(map(get_version_name, user_ids))
+
+
+def invalidate_for_recipes(recipe_ids):
+    """Сбрасывает списки покупок всех, у кого рецепты лежат в корзине."""
+    invalidate(set(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True)))
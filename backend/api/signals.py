@@ -0,0 +1,175 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import (
+    authentication,
+    conditional,
+    images,
+    recipe_cache,
+    shopping_list,
+)
+from foodgram.on_commit import OnCommitBatch, is_scheduled
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from recipes.signals import ingredients_imported
+from users.models import CustomUser
+
+AUTHOR_FIELDS = {
+    'email', 'username', 'first_name', 'last_name', 'avatar'
+}
+
+
+def invalidate_recipes(recipe_ids):
+    shopping_list.invalidate_for_recipes(recipe_ids)
+    recipe_cache.invalidate(recipe_ids)
+
+
+recipe_invalidations = OnCommitBatch(invalidate_recipes)
+
+
+def invalidate_recipes_on_commit(recipe_ids):
+    """Сбрасывает кеши рецептов после фиксации транзакции.
+
+    Изменения многих строк в одной транзакции сбрасываются одним
+    обращением, а не по запросу на каждую строку. Сброс до фиксации
+    позволил бы параллельному запросу снова закешировать старое
+    представление.
+    """
+    recipe_invalidations.add(recipe_ids)
+
+
+def touch_recipes(recipe_ids):
+    """Сдвигает updated_at рецептов, кеши сбрасывает после фиксации."""
+    recipe_ids = list(recipe_ids)
+    recipe_cache.touch(recipe_ids)
+    invalidate_recipes_on_commit(recipe_ids)
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def invalidate_user_shopping_list(instance, **kwargs):
+    transaction.on_commit(
+        partial(shopping_list.invalidate, [instance.user_id])
+    )
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    invalidate_recipes_on_commit([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        touch_recipes(
+            instance.recipe_ingredients.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver(ingredients_imported)
+def bump_catalog_version(**kwargs):
+    """Сдвигает версию каталога один раз после фиксации транзакции.
+
+    Версия, сдвинутая до фиксации, позволила бы другому воркеру
+    закешировать под ней ещё старые строки.
+    """
+    if not is_scheduled(conditional.bump_catalog_version):
+        transaction.on_commit(conditional.bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def build_recipe_image_variants(instance, **kwargs):
+    name = instance.image.name
+    if name and name != instance.image_variants_name:
+        images.schedule_variants(
+            name, partial(recipe_image_variants_built, instance.pk, name)
+        )
+
+
+def recipe_image_variants_built(recipe_id, name):
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants_name=name
+    ):
+        touch_recipes([recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes_on_commit([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(pk_set)
+    elif action == 'pre_clear':
+        touch_recipes(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_recipes(instance, **kwargs):
+    if not kwargs.get('created'):
+        touch_recipes(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_recipes(instance, created, update_fields, **kwargs):
+    if created or (update_fields and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    touch_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    transaction.on_commit(partial(authentication.invalidate, keys))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    transaction.on_commit(partial(authentication.invalidate, [instance.key]))
+
+
+@receiver(post_save, sender=CustomUser)
+def build_avatar_variants(instance, update_fields, **kwargs):
+    if update_fields and 'avatar' not in update_fields:
+        return
+    name = instance.avatar.name
+    if name and name != instance.avatar_variants_name:
+        images.schedule_variants(
+            name, partial(avatar_variants_built, instance.pk, name)
+        )
+
+
+def avatar_variants_built(user_id, name):
+    if CustomUser.objects.filter(pk=user_id, avatar=name).update(
+        avatar_variants_name=name
+    ):
+        touch_recipes(
+            Recipe.objects.filter(author_id=user_id).values_list(
+                'id', flat=True
+            )
+        )
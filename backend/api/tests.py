@@ -0,0 +1,685 @@
+import shutil
+import tempfile
+from base64 import b64encode
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import recipe_cache
+from api.authentication import AUTH_FIELDS, get_cache_key
+from api.conditional import bump_catalog_version, get_catalog_version
+from api.management.commands.benchmark_api import make_image
+from api.profiling import fingerprint
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from users.models import CustomUser, Subscription
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+ISOLATED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-tests',
+    }
+}
+
+# Наибольшее допустимое число SQL-запросов при холодном кеше, включая
+# запрос аутентификации по токену и работу, отложенную до фиксации
+# транзакции. Запись рецепта включает перестроение его поискового
+# документа: один запрос в PostgreSQL, шесть в SQLite. Подбор по продуктам
+# при холодном кеше строит индекс одним запросом. Создание рецепта
+# копирует его в ленты подписчиков: выборка подписчиков и, если они есть,
+# вставка записей. После фиксации сброс кешей рецепта ищет корзины с ним для
+# сброса списков покупок. Транзакции внутри теста выполняются как точки
+# сохранения, их SAVEPOINT и RELEASE тоже считаются.
+BUDGETS = {
+    'tags-list': 2,
+    'ingredients-list': 2,
+    'recipes-list': 6,
+    'recipes-list-anonymous': 5,
+    'recipes-list-cursor': 5,
+    'recipes-list-filtered': 8,
+    'recipes-list-popular': 6,
+    'recipes-list-trending-cursor': 5,
+    'recipes-detail': 5,
+    'recipes-pantry': 6,
+    'recipes-feed': 7,
+    'recipes-create': 24,
+    'recipes-partial-update': 21,
+    'recipes-download-shopping-cart': 2,
+    'users-list': 3,
+    'users-detail': 2,
+    'users-me': 2,
+    'users-subscriptions': 4,
+}
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def describe(title, queries):
+    """Заголовок и список запросов, повторы помечены звёздочкой."""
+    seen = set()
+    repeated = set()
+    for query in queries:
+        key = fingerprint(query['sql'])
+        if key in seen:
+            repeated.add(key)
+        seen.add(key)
+    lines = [title]
+    for number, query in enumerate(queries, 1):
+        mark = '*' if fingerprint(query['sql']) in repeated else ' '
+        lines.append(f'{mark}{number:>3}. {query["sql"]}')
+    return '\n'.join(lines)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=ISOLATED_CACHE)
+class APITestCase(TestCase):
+    """Набор данных для тестов API.
+
+    Читатель подписан на десять авторов с двумя рецептами у каждого,
+    у отдельного автора двенадцать рецептов, на него читатель не подписан.
+    Работа, отложенная до фиксации транзакции, выполняется сразу, кроме
+    построения вариантов изображений в фоновом потоке.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(mock.patch('api.images.submit'))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_data()
+
+    @classmethod
+    def create_data(cls):
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(3)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(12)
+        )
+        cls.reader = CustomUser.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            first_name='Читатель',
+            last_name='Читатель',
+            password='password',
+        )
+        cls.author = cls.create_author('author', 12)
+        followed = [
+            cls.create_author(f'followed{number}', 2)
+            for number in range(10)
+        ]
+        for author in followed:
+            Subscription.objects.create(user=cls.reader, author=author)
+        recipes = Recipe.objects.filter(author__in=followed)
+        for recipe in recipes[:5]:
+            Favorite.objects.create(user=cls.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        cls.recipe = cls.author.recipes.first()
+        cls.token = Token.objects.create(user=cls.reader)
+
+    @classmethod
+    def create_author(cls, username, recipes):
+        author = CustomUser.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            first_name='Автор',
+            last_name='Автор',
+        )
+        for number in range(recipes):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {username} {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            recipe.tags.set(cls.tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+                for ingredient in cls.ingredients[:number % 3 + 2]
+            )
+        return author
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.anonymous = APIClient()
+        cache.clear()
+
+
+class QueryBudgetTest(APITestCase):
+    """Бюджеты SQL-запросов эндпоинтов.
+
+    Каждый бюджет проверяется на двух размерах страницы (или числах
+    ингредиентов рецепта): число запросов не должно превышать бюджет и
+    расти с размером. При нарушении в сообщении перечислены запросы.
+    """
+
+    sizes = (1, 10)
+
+    def assertQueryBudget(self, name):
+        small, large = (self.measure(name, size) for size in self.sizes)
+        budget = BUDGETS[name]
+        if len(large) > budget:
+            self.fail(describe(
+                f'{name}: {len(large)} запросов при бюджете {budget}', large
+            ))
+        if len(large) > len(small):
+            self.fail(describe(
+                f'{name}: число запросов растёт с размером страницы '
+                f'({len(small)} при {self.sizes[0]}, '
+                f'{len(large)} при {self.sizes[1]})',
+                large
+            ))
+
+    def measure(self, name, size):
+        prepare = getattr(self, f'prepare_{name.replace("-", "_")}')
+        method, url, data, client = prepare(size)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                if method == 'get':
+                    response = client.get(url, data)
+                else:
+                    response = getattr(client, method)(
+                        url, data, format='json'
+                    )
+            content = (
+                b''.join(response.streaming_content)
+                if response.streaming else response.content
+            )
+        self.assertLess(response.status_code, 400, content)
+        return queries.captured_queries
+
+    def recipe_data(self, size):
+        return {
+            'name': 'Проверка бюджета',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image(),
+            'tags': [tag.pk for tag in self.tags[:size]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 100}
+                for ingredient in self.ingredients[:size]
+            ],
+        }
+
+    def prepare_tags_list(self, size):
+        return 'get', '/api/tags/', None, self.client
+
+    def prepare_ingredients_list(self, size):
+        return 'get', '/api/ingredients/', {'limit': size}, self.client
+
+    def prepare_recipes_list(self, size):
+        return 'get', '/api/recipes/', {'limit': size}, self.client
+
+    def prepare_recipes_list_anonymous(self, size):
+        return 'get', '/api/recipes/', {'limit': size}, self.anonymous
+
+    def prepare_recipes_list_cursor(self, size):
+        return 'get', '/api/recipes/', {
+            'limit': size, 'pagination': 'cursor'
+        }, self.client
+
+    def prepare_recipes_list_popular(self, size):
+        return 'get', '/api/recipes/', {
+            'limit': size, 'ordering': 'popular'
+        }, self.client
+
+    def prepare_recipes_list_trending_cursor(self, size):
+        return 'get', '/api/recipes/', {
+            'limit': size, 'ordering': 'trending', 'pagination': 'cursor'
+        }, self.client
+
+    def prepare_recipes_list_filtered(self, size):
+        return 'get', '/api/recipes/', {
+            'limit': size,
+            'tags': [tag.slug for tag in self.tags],
+            'author': self.author.pk,
+        }, self.client
+
+    def prepare_recipes_detail(self, size):
+        return 'get', f'/api/recipes/{self.recipe.pk}/', None, self.client
+
+    def prepare_recipes_pantry(self, size):
+        return 'get', '/api/recipes/pantry/', {
+            'limit': size,
+            'ingredients': [
+                ingredient.pk for ingredient in self.ingredients[:2]
+            ],
+        }, self.client
+
+    def prepare_recipes_feed(self, size):
+        return 'get', '/api/recipes/feed/', {'limit': size}, self.client
+
+    def prepare_recipes_create(self, size):
+        return 'post', '/api/recipes/', self.recipe_data(size), self.client
+
+    def prepare_recipes_partial_update(self, size):
+        data = self.recipe_data(size)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.client.post(
+                '/api/recipes/', data, format='json'
+            ).json()['id']
+        data.pop('image')
+        return 'patch', f'/api/recipes/{recipe_id}/', data, self.client
+
+    def prepare_recipes_download_shopping_cart(self, size):
+        return 'get', '/api/recipes/download_shopping_cart/', {
+            'format': 'txt'
+        }, self.client
+
+    def prepare_users_list(self, size):
+        return 'get', '/api/users/', {'limit': size}, self.client
+
+    def prepare_users_detail(self, size):
+        return 'get', f'/api/users/{self.author.pk}/', None, self.client
+
+    def prepare_users_me(self, size):
+        return 'get', '/api/users/me/', None, self.client
+
+    def prepare_users_subscriptions(self, size):
+        return 'get', '/api/users/subscriptions/', {
+            'limit': size, 'recipes_limit': size
+        }, self.client
+
+    def test_tags_list(self):
+        self.assertQueryBudget('tags-list')
+
+    def test_ingredients_list(self):
+        self.assertQueryBudget('ingredients-list')
+
+    def test_recipes_list(self):
+        self.assertQueryBudget('recipes-list')
+
+    def test_recipes_list_anonymous(self):
+        self.assertQueryBudget('recipes-list-anonymous')
+
+    def test_recipes_list_cursor(self):
+        self.assertQueryBudget('recipes-list-cursor')
+
+    def test_recipes_list_filtered(self):
+        self.assertQueryBudget('recipes-list-filtered')
+
+    def test_recipes_list_popular(self):
+        self.assertQueryBudget('recipes-list-popular')
+
+    def test_recipes_list_trending_cursor(self):
+        self.assertQueryBudget('recipes-list-trending-cursor')
+
+    def test_recipes_detail(self):
+        self.assertQueryBudget('recipes-detail')
+
+    def test_recipes_pantry(self):
+        self.assertQueryBudget('recipes-pantry')
+
+    def test_recipes_feed(self):
+        self.assertQueryBudget('recipes-feed')
+
+    def test_recipes_create(self):
+        self.assertQueryBudget('recipes-create')
+
+    def test_recipes_partial_update(self):
+        self.assertQueryBudget('recipes-partial-update')
+
+    def test_recipes_download_shopping_cart(self):
+        self.assertQueryBudget('recipes-download-shopping-cart')
+
+    def test_users_list(self):
+        self.assertQueryBudget('users-list')
+
+    def test_users_detail(self):
+        self.assertQueryBudget('users-detail')
+
+    def test_users_me(self):
+        self.assertQueryBudget('users-me')
+
+    def test_users_subscriptions(self):
+        self.assertQueryBudget('users-subscriptions')
+
+
+def get_unique_index(model, name):
+    """Имя индекса ограничения уникальности, как его показывает план.
+
+    SQLite создаёт для такого ограничения автоматический индекс
+    sqlite_autoindex_<таблица>_<номер>.
+    """
+    if connection.vendor == 'sqlite':
+        return f'sqlite_autoindex_{model._meta.db_table}_1'
+    return name
+
+
+class IndexPlanTest(APITestCase):
+    """Запросы эндпоинтов используют индексы своих путей доступа.
+
+    Каждый SELECT эндпоинта разбирается через EXPLAIN, хотя бы один план
+    должен содержать ожидаемый индекс. В PostgreSQL последовательное
+    чтение отключается: на маленьких таблицах тестов оно всегда дешевле.
+    """
+
+    def get_plans(self, url, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, data)
+        explain = (
+            'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+            else 'EXPLAIN '
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute(explain + query['sql'])
+                    yield '\n'.join(
+                        str(row[-1]) for row in cursor.fetchall()
+                    )
+
+    def assertUsesIndex(self, index, url, data=None):
+        plans = list(self.get_plans(url, data))
+        self.assertTrue(
+            any(index in plan for plan in plans),
+            f'{index} не используется:\n\n' + '\n\n'.join(plans)
+        )
+
+    def test_recipes_list(self):
+        self.assertUsesIndex('recipe_pub_date_idx', '/api/recipes/')
+
+    def test_recipes_list_by_author(self):
+        self.assertUsesIndex(
+            'recipe_author_pub_date_idx',
+            '/api/recipes/',
+            {'author': self.author.pk}
+        )
+
+    def test_recipes_list_popular(self):
+        self.assertUsesIndex(
+            'recipe_popular_score_idx',
+            '/api/recipes/',
+            {'ordering': 'popular'}
+        )
+
+    def test_recipes_list_trending(self):
+        self.assertUsesIndex(
+            'recipe_trending_score_idx',
+            '/api/recipes/',
+            {'ordering': 'trending'}
+        )
+
+    def test_recipes_list_favorited(self):
+        self.assertUsesIndex(
+            get_unique_index(Favorite, 'unique_favorite'),
+            '/api/recipes/',
+            {'is_favorited': 1}
+        )
+
+    def test_recipes_list_in_shopping_cart(self):
+        self.assertUsesIndex(
+            get_unique_index(ShoppingCart, 'unique_shopping_cart'),
+            '/api/recipes/',
+            {'is_in_shopping_cart': 1}
+        )
+
+    def test_recipes_feed(self):
+        self.assertUsesIndex(
+            'feed_item_user_pub_date_idx', '/api/recipes/feed/'
+        )
+
+    def test_users_subscriptions(self):
+        self.assertUsesIndex(
+            get_unique_index(Subscription, 'unique_subscription'),
+            '/api/users/subscriptions/'
+        )
+
+
+class RecipeCacheTest(APITestCase):
+    """Кеш представлений рецептов сбрасывается после фиксации транзакции.
+
+    Сброс внутри транзакции позволил бы параллельному запросу снова
+    закешировать старое представление до фиксации.
+    """
+
+    def assertInvalidatedOnCommit(self, change):
+        self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        key = recipe_cache.get_cache_key(self.recipe.pk)
+        self.assertIsNotNone(cache.get(key))
+        with self.captureOnCommitCallbacks() as callbacks:
+            change()
+            self.assertIsNotNone(cache.get(key))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(key))
+
+    def test_recipe_update(self):
+        self.recipe.name = 'Новое название'
+        self.assertInvalidatedOnCommit(self.recipe.save)
+
+    def test_recipe_tags(self):
+        self.assertInvalidatedOnCommit(
+            lambda: self.recipe.tags.set(self.tags[:1])
+        )
+
+    def test_recipe_ingredients(self):
+        self.assertInvalidatedOnCommit(
+            lambda: self.recipe.recipe_ingredients.all().delete()
+        )
+
+    def test_tag_rename(self):
+        tag = self.tags[0]
+        tag.name = 'Новый тег'
+        self.assertInvalidatedOnCommit(tag.save)
+
+    def test_ingredient_rename(self):
+        ingredient = self.ingredients[0]
+        ingredient.name = 'Новый продукт'
+        self.assertInvalidatedOnCommit(ingredient.save)
+
+    def test_author_rename(self):
+        self.author.first_name = 'Новое имя'
+        self.assertInvalidatedOnCommit(self.author.save)
+
+
+class SearchTest(APITestCase):
+    """Поиск рецептов: основы слов, все слова запроса и порядок по рангу.
+
+    Совпадение в названии весит больше, чем в ингредиентах, а в
+    ингредиентах — больше, чем в описании; при равном ранге новые рецепты
+    идут первыми.
+    """
+
+    @classmethod
+    def create_data(cls):
+        super().create_data()
+        cls.cabbage = Ingredient.objects.create(
+            name='Капуста', measurement_unit='г'
+        )
+        cls.by_text = cls.create_recipe('Пирог', 'Начинка из капусты')
+        cls.by_ingredient = cls.create_recipe(
+            'Щи', 'Варить час', [cls.cabbage]
+        )
+        cls.by_name = cls.create_recipe('Суп с капустой', 'Варить час')
+        cls.salad = cls.create_recipe('Салат', 'Свежие огурцы')
+        cls.old_borscht = cls.create_recipe('Борщ', 'Свёкла')
+        cls.new_borscht = cls.create_recipe('Борщ', 'Свёкла')
+
+    @classmethod
+    def create_recipe(cls, name, text, ingredients=()):
+        recipe = Recipe.objects.create(
+            author=cls.author,
+            name=name,
+            text=text,
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_stemmed_match(self):
+        self.assertEqual(
+            self.search('свежими огурцами'), [self.salad.pk]
+        )
+
+    def test_all_words_required(self):
+        self.assertEqual(self.search('капуста огурцы'), [])
+
+    def test_stop_words_only(self):
+        self.assertEqual(self.search('и с на'), [])
+
+    def test_rank_by_field(self):
+        self.assertEqual(self.search('капуста'), [
+            self.by_name.pk, self.by_ingredient.pk, self.by_text.pk
+        ])
+
+    def test_newest_first_on_equal_rank(self):
+        self.assertEqual(
+            self.search('борщ'), [self.new_borscht.pk, self.old_borscht.pk]
+        )
+
+    def test_ingredient_rename_reindexes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cabbage.name = 'Щавель'
+            self.cabbage.save()
+        self.assertEqual(self.search('щавелем'), [self.by_ingredient.pk])
+
+
+class CatalogVersionTest(APITestCase):
+    """Версия каталога сдвигается после фиксации, один раз на транзакцию."""
+
+    def test_bumped_on_commit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            for tag in self.tags:
+                tag.name += ' новый'
+                tag.save()
+            Ingredient.objects.create(
+                name='Новый продукт', measurement_unit='г'
+            )
+            self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(callbacks.count(bump_catalog_version), 1)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_catalog_version(), version)
+
+
+class CursorPaginationTest(APITestCase):
+    """Курсорная пагинация отвечает 404 на испорченный курсор."""
+
+    cursors = (
+        '[false, null, null]',
+        '[false, "", ""]',
+        '[false, [1], {"id": 1}]',
+        '[false, true, false]',
+        '[false, "2024-01-01T00:00:00", "x"]',
+        '[false, "2024-01-01T00:00:00"]',
+        '{}',
+    )
+
+    def assertRejectsCursors(self, url, data=None):
+        for cursor in self.cursors:
+            with self.subTest(url=url, cursor=cursor):
+                response = self.client.get(url, {
+                    **(data or {}),
+                    'cursor': b64encode(cursor.encode()).decode(),
+                })
+                self.assertEqual(response.status_code, 404)
+
+    def test_recipes(self):
+        self.assertRejectsCursors('/api/recipes/', {'pagination': 'cursor'})
+
+    def test_users(self):
+        self.assertRejectsCursors('/api/users/', {'pagination': 'cursor'})
+
+    def test_feed(self):
+        self.assertRejectsCursors('/api/recipes/feed/')
+
+    def test_next_link(self):
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5}
+        )
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 5)
+
+
+class TokenAuthenticationTest(APITestCase):
+    """Кеш токенов хранит только id и флаги пользователя."""
+
+    def test_cache_stores_auth_fields(self):
+        self.client.get('/api/users/me/')
+        self.assertEqual(
+            set(cache.get(get_cache_key(self.token.key))), set(AUTH_FIELDS)
+        )
+
+    def test_cached_user(self):
+        self.client.get('/api/users/me/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_me_is_read_from_database(self):
+        self.client.get('/api/users/me/')
+        CustomUser.objects.filter(pk=self.reader.pk).update(first_name='Имя')
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.json()['first_name'], 'Имя')
+
+    def test_write_loads_full_user(self):
+        self.client.get('/api/users/me/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(
+                '/api/users/me/avatar/', {'avatar': make_image()},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        # Пользователь, UPDATE его полей, рецепты и токены для сигналов.
+        self.assertEqual(len(queries), 4, describe('avatar', queries))
+        response = self.client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        self.reader.refresh_from_db()
+        self.assertFalse(self.reader.avatar)
+        self.assertEqual(self.reader.first_name, 'Читатель')
+
+    def test_deactivation_invalidates_on_commit(self):
+        self.client.get('/api/users/me/')
+        key = get_cache_key(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.is_active = False
+            self.reader.save()
+            self.assertIsNotNone(cache.get(key))
+        self.assertIsNone(cache.get(key))
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalid_token(self):
+        self.anonymous.credentials(HTTP_AUTHORIZATION='Token invalid')
+        response = self.anonymous.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(cache.get(get_cache_key('invalid')))
@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     CustomUserViewSet, TagViewSet,
-    IngredientViewSet, RecipeViewSet
+    IngredientViewSet, RecipeViewSet,
+    ProfilingStatsView
 )
 
 app_name = 'api'
@@ -17,4 +18,5 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('profiling/', ProfilingStatsView.as_view(), name='profiling'),
 ]
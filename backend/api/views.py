@@ -1,44 +1,74 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
-
-from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import CustomPageNumberPagination
+from rest_framework.views import APIView
+
+from api import shopping_list
+from api.conditional import conditional_response, get_catalog_version
+from api.filters import RecipeFilter
+from api.images import delete_variants
+from api.pagination import (
+    CustomPageNumberPagination,
+    FeedPagination,
+    RecipePagination,
+    UserPagination,
+)
 from api.permissions import IsAuthorOrReadOnly
+from api.profiling import stats
+from api.renderers import (
+    CSVRenderer,
+    JSONRenderer,
+    PDFRenderer,
+    PlainTextRenderer,
+)
 from api.serializers import (
     AvatarSerializer,
     CustomUserSerializer,
     IngredientSerializer,
+    PantryRecipeSerializer,
     RecipeCreateUpdateSerializer,
     RecipeSerializer,
     RecipeShortSerializer,
     SubscriptionSerializer,
     TagSerializer,
 )
+from foodgram import cache
 from foodgram.constants import (
+    CATALOG_CACHE_MAX_AGE,
+    CATALOG_CACHE_TIMEOUT,
     ERROR_ALREADY_SUBSCRIBED,
+    ERROR_INGREDIENT_SEARCH_MODE,
     ERROR_NOT_SUBSCRIBED,
+    ERROR_PANTRY_INGREDIENTS,
+    ERROR_PANTRY_MAX_MISSING,
     ERROR_RECIPE_ALREADY_ADDED,
     ERROR_RECIPE_NOT_ADDED,
     ERROR_SELF_SUBSCRIPTION,
+    INGREDIENT_SEARCH_LIMIT,
+    PANTRY_MAX_INGREDIENTS,
+)
+from recipes.ingredient_index import (
+    SEARCH_MODES,
+    SEARCH_PREFIX,
+    ingredient_index,
 )
+from recipes.pantry import pantry_index
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
     Tag,
 )
@@ -50,7 +80,10 @@ class CustomUserViewSet(DjoserUserViewSet):
 
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = UserPagination
+
+    def get_queryset(self):
+        return super().get_queryset().with_is_subscribed(self.request.user)
 
     @action(
         detail=False,
@@ -58,7 +91,10 @@ class CustomUserViewSet(DjoserUserViewSet):
         permission_classes=[IsAuthenticated]
     )
     def me(self, request):
-        serializer = self.get_serializer(request.user)
+        """Профиль из базы: у request.user загружены только поля входа."""
+        serializer = self.get_serializer(
+            self.get_queryset().get(pk=request.user.pk)
+        )
         return Response(serializer.data)
 
     @action(
@@ -75,6 +111,8 @@ class CustomUserViewSet(DjoserUserViewSet):
             serializer.save()
             return Response(serializer.data)
 
+        if user.avatar:
+            delete_variants(user.avatar.name)
         user.avatar.delete()
         user.avatar = None
         user.save()
@@ -86,8 +124,17 @@ class CustomUserViewSet(DjoserUserViewSet):
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
+        recipes = Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit:
+            try:
+                recipes = recipes[:int(recipes_limit)]
+            except (ValueError, TypeError):
+                pass
         subscriptions = CustomUser.objects.filter(
             subscribed_to__user=request.user
+        ).with_is_subscribed(request.user).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_page')
         )
         page = self.paginate_queryset(subscriptions)
         serializer = SubscriptionSerializer(
@@ -129,22 +176,47 @@ class CustomUserViewSet(DjoserUserViewSet):
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscription = Subscription.objects.filter(
+        deleted, _ = Subscription.objects.filter(
             user=request.user,
             author=author
-        )
+        ).delete()
 
-        if not subscription.exists():
+        if not deleted:
             return Response(
                 {'errors': ERROR_NOT_SUBSCRIBED},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class CatalogConditionalMixin:
+    """Условные GET для справочников по общей версии каталога."""
+
+    def catalog_response(self, request, build):
+        version = get_catalog_version()
+        return conditional_response(
+            request,
+            f'catalog-{version}',
+            version / 10 ** 9,
+            build,
+            public=True,
+            max_age=CATALOG_CACHE_MAX_AGE
+        )
+
+    def list(self, request, *args, **kwargs):
+        handler = super().list
+        return self.catalog_response(
+            request, lambda: handler(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        handler = super().retrieve
+        return self.catalog_response(
+            request, lambda: handler(request, *args, **kwargs)
+        )
+
+
+class TagViewSet(CatalogConditionalMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тегов."""
 
     queryset = Tag.objects.all()
@@ -152,16 +224,51 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        key = cache.make_key('tags', get_catalog_version())
+        return self.catalog_response(request, lambda: Response(
+            cache.get_or_set(
+                key,
+                lambda: list(
+                    self.get_serializer(self.get_queryset(), many=True).data
+                ),
+                CATALOG_CACHE_TIMEOUT
+            )
+        ))
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Вьюсет для ингредиентов."""
+class IngredientViewSet(
+    CatalogConditionalMixin,
+    viewsets.ReadOnlyModelViewSet
+):
+    """Вьюсет для ингредиентов.
+
+    Список отдаётся из индекса в памяти процесса: поиск по началу названия
+    (name), по вхождению (mode=contains) или с опечатками (mode=fuzzy).
+    """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
     pagination_class = None
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '')
+        mode = request.query_params.get('mode', SEARCH_PREFIX)
+        if mode not in SEARCH_MODES:
+            raise ValidationError({'mode': ERROR_INGREDIENT_SEARCH_MODE})
+
+        limit = None
+        if name:
+            limit = INGREDIENT_SEARCH_LIMIT
+            try:
+                limit = max(min(int(request.query_params['limit']), limit), 0)
+            except (KeyError, ValueError):
+                pass
+        return self.catalog_response(
+            request,
+            lambda: Response(ingredient_index.search(name, mode, limit))
+        )
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -169,15 +276,116 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def handle_exception(self, exc):
+        """Ошибки выгрузки списка покупок отдаются в JSON, а не как файл."""
+        if self.action == 'download_shopping_cart':
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        flags = ''.join(
+            str(int(bool(getattr(recipe, name, False))))
+            for name in (
+                'is_favorited',
+                'is_in_shopping_cart',
+                'is_subscribed_to_author',
+            )
+        )
+        modified = recipe.updated_at.timestamp()
+        cache_control = {'no_cache': True}
+        if request.user.is_authenticated:
+            cache_control['private'] = True
+        else:
+            cache_control['public'] = True
+        return conditional_response(
+            request,
+            f'recipe-{recipe.pk}-{int(modified * 10 ** 6)}-{flags}',
+            None if request.user.is_authenticated else modified,
+            lambda: Response(self.get_serializer(recipe).data),
+            **cache_control
+        )
+
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update', 'update']:
             return RecipeCreateUpdateSerializer
+        if self.action == 'pantry':
+            return PantryRecipeSerializer
         return RecipeSerializer
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя, от новых к старым."""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[AllowAny],
+        pagination_class=CustomPageNumberPagination
+    )
+    def pantry(self, request):
+        """Рецепты из имеющихся продуктов.
+
+        Ингредиенты передаются списком id в параметре ingredients
+        (повтором параметра или через запятую). Сначала идут рецепты,
+        где недостаёт меньше ингредиентов, затем с большей долей
+        имеющихся; max_missing ограничивает число недостающих.
+        """
+        try:
+            ingredient_ids = {
+                int(value)
+                for values in request.query_params.getlist('ingredients')
+                for value in values.split(',')
+                if value.strip()
+            }
+        except ValueError:
+            ingredient_ids = set()
+        if not 0 < len(ingredient_ids) <= PANTRY_MAX_INGREDIENTS:
+            raise ValidationError({'ingredients': ERROR_PANTRY_INGREDIENTS})
+
+        max_missing = request.query_params.get('max_missing')
+        if max_missing is not None:
+            try:
+                max_missing = int(max_missing)
+                if max_missing < 0:
+                    raise ValueError
+            except ValueError:
+                raise ValidationError(
+                    {'max_missing': ERROR_PANTRY_MAX_MISSING}
+                )
+
+        page = self.paginate_queryset(
+            pantry_index.match(ingredient_ids, max_missing)
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        results = []
+        for recipe_id, missing_count, found_count in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.missing_count = missing_count
+                recipe.found_count = found_count
+                results.append(recipe)
+        serializer = self.get_serializer(results, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['get'],
@@ -207,15 +415,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def delete_from(self, model, request, pk):
         recipe = get_object_or_404(Recipe, id=pk)
-        obj = model.objects.filter(user=request.user, recipe=recipe)
+        deleted, _ = model.objects.filter(
+            user=request.user,
+            recipe=recipe
+        ).delete()
 
-        if not obj.exists():
+        if not deleted:
             return Response(
                 {'errors': ERROR_RECIPE_NOT_ADDED},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -245,42 +454,43 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            PDFRenderer, PlainTextRenderer, CSVRenderer, JSONRenderer
+        ]
     )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_carts__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by('ingredient__name')
-
-        response = HttpResponse(content_type='application/pdf')
+        renderer = request.accepted_renderer
+        content = shopping_list.get_shopping_list(
+            request.user,
+            renderer.format
+        )
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            shopping_list.iter_chunks(content),
+            content_type=content_type
+        )
+        response['Content-Length'] = len(content)
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.pdf"'
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
+        return response
 
-        p = canvas.Canvas(response, pagesize=A4)
 
-        p.setFont('Helvetica', 14)
-        p.drawString(100, 800, 'Shopping List')
+class ProfilingStatsView(APIView):
+    """Статистика профилирования запросов и кеша текущего процесса."""
 
-        y = 750
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['total_amount']
-            text = f"{name} ({unit}) - {amount}"
-            p.drawString(100, y, text)
-            y -= 20
-            if y < 50:
-                p.showPage()
-                p.setFont('Helvetica', 14)
-                y = 800
+    permission_classes = [IsAdminUser]
 
-        p.showPage()
-        p.save()
+    def get(self, request):
+        return Response({
+            'views': stats.snapshot(),
+            'cache': cache.metrics.snapshot(),
+        })
 
-        return response
+    def delete(self, request):
+        stats.reset()
+        cache.metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
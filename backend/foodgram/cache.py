@@ -0,0 +1,158 @@
+"""
+Общий кеш приложения поверх бэкенда из settings.CACHES.
+
+Ключи имеют вид <пространство>:<версия формата>:<части>. Версии форматов
+перечислены в CACHE_NAMESPACES и увеличиваются, когда меняется структура
+кешируемых данных, поэтому после выкладки старые записи не читаются.
+get_or_set не даёт нескольким воркерам одновременно пересчитывать одно
+значение (cache stampede): пересчитывает тот, кто взял блокировку,
+остальные недолго ждут готового результата. Попадания и промахи
+по пространствам считаются в metrics.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from foodgram.constants import (
+    CACHE_LOCK_POLL,
+    CACHE_LOCK_TIMEOUT,
+    CACHE_LOCK_WAIT,
+    CACHE_NAMESPACES,
+)
+
+
+def make_key(namespace, *parts):
+    return ':'.join(
+        str(part) for part in (namespace, CACHE_NAMESPACES[namespace], *parts)
+    )
+
+
+def get_namespace(key):
+    return key.split(':', 1)[0]
+
+
+class CacheMetrics:
+    """Счётчики попаданий и промахов кеша в текущем процессе."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def record(self, namespace, hits=0, misses=0):
+        with self.lock:
+            self.hits[namespace] += hits
+            self.misses[namespace] += misses
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                namespace: {
+                    'hits': self.hits[namespace],
+                    'misses': self.misses[namespace],
+                    'hit_rate': round(
+                        self.hits[namespace] / (
+                            self.hits[namespace] + self.misses[namespace]
+                        ),
+                        3
+                    ),
+                }
+                for namespace in sorted(self.hits | self.misses)
+            }
+
+    def reset(self):
+        with self.lock:
+            self.hits.clear()
+            self.misses.clear()
+
+
+metrics = CacheMetrics()
+
+
+def is_process_local():
+    """Виден ли кеш только текущему процессу (locmem, dummy)."""
+    return isinstance(
+        caches[DEFAULT_CACHE_ALIAS], (DummyCache, LocMemCache)
+    )
+
+
+def get(key, default=None):
+    value = cache.get(key)
+    hit = int(value is not None)
+    metrics.record(get_namespace(key), hits=hit, misses=1 - hit)
+    return default if value is None else value
+
+
+def get_many(keys):
+    keys = list(keys)
+    found = cache.get_many(keys)
+    for namespace, total in Counter(map(get_namespace, keys)).items():
+        hits = sum(get_namespace(key) == namespace for key in found)
+        metrics.record(namespace, hits, total - hits)
+    return found
+
+
+def set_many(values, timeout):
+    cache.set_many(values, timeout)
+
+
+def delete_many(keys):
+    cache.delete_many(list(keys))
+
+
+def incr(key):
+    """Атомарно увеличивает счётчик key, создавая его при отсутствии."""
+    cache.add(key, 0, None)
+    return cache.incr(key)
+
+
+def get_or_set(key, build, timeout):
+    """Возвращает значение из кеша или строит его под блокировкой."""
+    namespace = get_namespace(key)
+    value = cache.get(key)
+    if value is not None:
+        metrics.record(namespace, hits=1)
+        return value
+    metrics.record(namespace, misses=1)
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, True, CACHE_LOCK_TIMEOUT):
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(CACHE_LOCK_POLL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return build()
+    try:
+        value = build()
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def get_version(name):
+    """Текущая версия набора данных name, меняется при bump_version."""
+    key = make_key('version', name)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    bump_versions([name])
+
+
+def bump_versions(names):
+    version = time.time_ns()
+    cache.set_many(
+        {make_key('version', name): version for name in names}, None
+    )
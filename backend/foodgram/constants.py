@@ -11,10 +11,82 @@ MAX_LENGTH_TAG_SLUG = 32
 MAX_LENGTH_INGREDIENT_NAME = 128
 MAX_LENGTH_INGREDIENT_UNIT = 64
 MAX_LENGTH_RECIPE_NAME = 256
+MAX_LENGTH_SEARCH_TERM = 64
+MAX_LENGTH_FILE_NAME = 100
 
 MIN_COOKING_TIME = 1
 MIN_INGREDIENT_AMOUNT = 1
 
+INGREDIENT_INDEX_TTL = 300
+INGREDIENT_SEARCH_LIMIT = 50
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_CACHE_TIMEOUT = 60 * 60
+CATALOG_CACHE_MAX_AGE = 60 * 5
+SYNTHETIC_USER_PASSWORD = 'synthetic-password'
+SYNTHETIC_USER_PREFIX = 'synthetic'
+
+CACHE_NAMESPACES = {
+    'version': 1,
+    'recipe': 1,
+    'shopping_list': 1,
+    'tags': 1,
+    'ingredients': 1,
+    'token': 1,
+    'pantry': 1,
+    'ranking': 1,
+}
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 2
+CACHE_LOCK_POLL = 0.05
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_VERSION = 'catalog'
+TOKEN_CACHE_TIMEOUT = 60 * 5
+
+SEARCH_CONFIG = 'russian'
+SEARCH_MAX_TERMS = 10
+SEARCH_INDEX_BATCH_SIZE = 1000
+# Веса полей как у ts_rank в PostgreSQL: A = 1.0, B = 0.4, C = 0.2.
+SEARCH_WEIGHTS = {'name': 'A', 'ingredients': 'B', 'text': 'C'}
+SEARCH_TERM_WEIGHTS = {'A': 10, 'B': 4, 'C': 2}
+SEARCH_STOP_WORDS = frozenset(
+    'без в во для до за и из к как или на над не но о об от по под при '
+    'с со у что это'.split()
+)
+
+PANTRY_VERSION = 'pantry'
+PANTRY_INDEX_TTL = 60 * 60
+PANTRY_CHANGES_TIMEOUT = 60 * 60
+PANTRY_MAX_CHANGES = 500
+PANTRY_MAX_INGREDIENTS = 100
+PANTRY_BATCH_SIZE = 1000
+
+# Рецепты авторов с большим числом подписчиков не копируются в ленты,
+# а читаются при запросе ленты.
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_SIZE = 100
+FEED_BATCH_SIZE = 1000
+
+# Рейтинги рецептов: веса добавлений в избранное и в список покупок,
+# период полураспада вклада добавления в trending_score (в секундах).
+RANKING_FAVORITE_WEIGHT = 1
+RANKING_SHOPPING_CART_WEIGHT = 2
+RANKING_TRENDING_HALF_LIFE = 3 * 24 * 60 * 60
+RANKING_BATCH_SIZE = 1000
+RECIPE_ORDERINGS = {
+    'popular': ('-popular_score', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+IMAGE_MAX_SIDE = 5000
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_VARIANTS = {
+    'small': (320, 320),
+    'medium': (960, 960),
+}
+IMAGE_WEBP_QUALITY = 80
+IMAGE_WORKERS = 2
+
 ERROR_USERNAME_ME = "Имя пользователя 'me' недопустимо."
 ERROR_USERNAME_INVALID = "Недопустимые символы в имени пользователя."
 ERROR_TAGS_REQUIRED = "Нужен хотя бы один тег."
@@ -28,3 +100,12 @@ ERROR_ALREADY_SUBSCRIBED = "Вы уже подписаны на этого по
 ERROR_NOT_SUBSCRIBED = "Вы не подписаны на этого пользователя."
 ERROR_RECIPE_ALREADY_ADDED = "Рецепт уже добавлен."
 ERROR_RECIPE_NOT_ADDED = "Рецепт не был добавлен."
+ERROR_INGREDIENT_SEARCH_MODE = "Неизвестный режим поиска ингредиентов."
+ERROR_INVALID_CURSOR = "Неверный курсор."
+ERROR_PANTRY_INGREDIENTS = (
+    f"Укажите от 1 до {PANTRY_MAX_INGREDIENTS} id ингредиентов."
+)
+ERROR_PANTRY_MAX_MISSING = "Должно быть целым неотрицательным числом."
+ERROR_IMAGE_TOO_LARGE = "Изображение слишком большое."
+ERROR_IMAGE_INVALID = "Некорректное изображение."
+ERROR_USER_INACTIVE = "Пользователь неактивен или удалён."
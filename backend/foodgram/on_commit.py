@@ -0,0 +1,47 @@
+"""
+Пачки id, обрабатываемые после фиксации транзакции.
+
+Сигналы моделей срабатывают на каждую строку, а кеши, поисковый индекс
+и журнал изменений удобнее обновлять один раз на транзакцию. OnCommitBatch
+копит id в пачке текущего потока и ставит в on_commit один обработчик
+пачки. Пачка действует, пока её обработчик стоит в очереди on_commit
+соединения: при откате транзакции (или точки сохранения, в которой пачка
+начата) Django убирает обработчик из очереди, следующая запись начинает
+новую пачку, и id отменённых изменений не обрабатываются. Вне транзакции
+обработчик вызывается сразу.
+"""
+import threading
+from functools import partial
+
+from django.db import transaction
+
+
+def is_scheduled(callback):
+    """Стоит ли callback в очереди on_commit текущей транзакции."""
+    connection = transaction.get_connection()
+    return connection.in_atomic_block and any(
+        entry[1] is callback for entry in connection.run_on_commit
+    )
+
+
+class OnCommitBatch:
+    """Копит id за транзакцию и передаёт их handler одним вызовом."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.local = threading.local()
+
+    def add(self, ids):
+        flush = getattr(self.local, 'flush', None)
+        if flush is not None and is_scheduled(flush):
+            flush.args[0].update(ids)
+        else:
+            self.local.flush = partial(self.flush, set(ids))
+            transaction.on_commit(self.local.flush)
+
+    def flush(self, ids):
+        flush = getattr(self.local, 'flush', None)
+        if flush is not None and flush.args[0] is ids:
+            del self.local.flush
+        if ids:
+            self.handler(list(ids))
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -35,6 +36,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False') == 'True'
+REQUEST_PROFILING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_PROFILING_SAMPLE_RATE', '0')
+)
+REQUEST_PROFILING_SLOW_MS = int(os.getenv('REQUEST_PROFILING_SLOW_MS', '500'))
+REQUEST_PROFILING_DIR = os.getenv(
+    'REQUEST_PROFILING_DIR', os.path.join(BASE_DIR, 'profiles')
+)
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -66,6 +76,41 @@ DATABASES = {
     }
 }
 
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+CACHE_BACKENDS = {
+    'redis': (
+        'django.core.cache.backends.redis.RedisCache',
+        'redis://redis:6379/1',
+    ),
+    'file': (
+        'django.core.cache.backends.filebased.FileBasedCache',
+        str(BASE_DIR / 'cache'),
+    ),
+    'locmem': (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'foodgram',
+    ),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[
+    os.getenv('CACHE_BACKEND', 'locmem')
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_LOCATION),
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'foodgram'),
+        'VERSION': int(os.getenv('CACHE_VERSION', '1')),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -101,7 +146,7 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
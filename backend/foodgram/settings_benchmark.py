@@ -0,0 +1,18 @@
+"""
+Настройки нагрузочных прогонов.
+
+Перед каждым SQL-запросом добавляется задержка DB_SIMULATED_LATENCY_MS
+(по умолчанию 20 мс), имитирующая удалённую базу данных. Включаются
+переменной DJANGO_SETTINGS_MODULE=foodgram.settings_benchmark и в рабочих
+развёртываниях не загружаются.
+"""
+import os
+
+from django.db.backends.signals import connection_created
+
+from api.profiling import add_simulated_latency
+from foodgram.settings import *  # noqa: F401,F403
+
+DB_SIMULATED_LATENCY_MS = float(os.getenv('DB_SIMULATED_LATENCY_MS', '20'))
+
+connection_created.connect(add_simulated_latency)
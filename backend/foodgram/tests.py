@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+
+from foodgram import cache
+from foodgram.on_commit import OnCommitBatch
+
+CACHE_DIR = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+class OnCommitBatchTest(TestCase):
+    """Пачка id обрабатывается один раз после фиксации транзакции."""
+
+    def setUp(self):
+        self.handled = []
+        self.batch = OnCommitBatch(
+            lambda ids: self.handled.append(sorted(ids))
+        )
+
+    def test_one_call_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.batch.add([1, 2])
+            self.batch.add([2, 3])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.handled, [[1, 2, 3]])
+
+    def test_new_batch_after_flush(self):
+        for ids in ([1], [2]):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.batch.add(ids)
+        self.assertEqual(self.handled, [[1], [2]])
+
+    def test_rollback_discards_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.batch.add([1])
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            self.batch.add([2])
+        self.assertEqual(self.handled, [[2]])
+
+
+class ProcessLocalCacheTest(TestCase):
+    """Пересчёт оценок предупреждает о кеше, не общем для процессов."""
+
+    def update_scores(self):
+        stderr = StringIO()
+        call_command('update_recipe_scores', stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_locmem_warns(self):
+        self.assertTrue(cache.is_process_local())
+        self.assertIn('CACHE_BACKEND', self.update_scores())
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    }})
+    def test_shared_cache(self):
+        self.assertFalse(cache.is_process_local())
+        self.assertEqual(self.update_scores(), '')
@@ -0,0 +1,17 @@
+"""
+Настройки gunicorn.
+
+SERVER_PROFILE=asgi запускает foodgram.asgi в воркерах uvicorn: один
+воркер обслуживает много запросов одновременно, пока они ждут базу
+данных. По умолчанию используются синхронные воркеры с foodgram.wsgi.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+
+if os.getenv('SERVER_PROFILE', 'wsgi') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
@@ -37,10 +37,6 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('tags',)
     inlines = [RecipeIngredientInline]
 
-    @admin.display(description='В избранном')
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -0,0 +1,124 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Лента материализуется в FeedItem при записи (fan-out on write): новый
+рецепт копируется в ленты подписчиков автора, при подписке в ленту
+добавляются FEED_BACKFILL_SIZE последних рецептов автора, при отписке
+его записи удаляются. Авторы, у которых подписчиков больше
+FEED_FANOUT_LIMIT, считаются популярными: их рецепты не копируются
+в тысячи лент, а читаются при запросе ленты (fan-out on read) и
+сливаются с материализованной частью.
+"""
+from foodgram.constants import (
+    FEED_BACKFILL_SIZE,
+    FEED_BATCH_SIZE,
+    FEED_FANOUT_LIMIT,
+)
+from recipes.models import FeedItem, Recipe
+from users.models import CustomUser, Subscription
+
+
+def get_popular_authors(user):
+    """Подзапрос id популярных авторов из подписок user."""
+    return Subscription.objects.filter(
+        user=user, author__subscribers_count__gt=FEED_FANOUT_LIMIT
+    ).order_by().values('author_id')
+
+
+def get_feed_sources(user):
+    """Материализованная часть ленты и рецепты популярных авторов."""
+    popular = get_popular_authors(user)
+    return (
+        FeedItem.objects.filter(user=user).exclude(author_id__in=popular),
+        Recipe.objects.filter(author_id__in=popular),
+    )
+
+
+def create_items(user_ids, recipes):
+    """Добавляет рецепты в ленты пользователей, пропуская имеющиеся."""
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(
+                user_id=user_id,
+                recipe_id=recipe['id'],
+                author_id=recipe['author_id'],
+                pub_date=recipe['pub_date'],
+            )
+            for user_id in user_ids
+            for recipe in recipes
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def get_recent_recipes(author_id):
+    """Последние рецепты автора, если он не популярный."""
+    return list(Recipe.objects.filter(
+        author_id=author_id,
+        author__subscribers_count__lte=FEED_FANOUT_LIMIT
+    ).order_by('-pub_date', '-id').values(
+        'id', 'author_id', 'pub_date'
+    )[:FEED_BACKFILL_SIZE])
+
+
+def fan_out_recipe(recipe):
+    """Копирует рецепт в ленты подписчиков автора."""
+    user_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id,
+        author__subscribers_count__lte=FEED_FANOUT_LIMIT
+    ).order_by().values_list('user_id', flat=True))
+    if user_ids:
+        create_items(user_ids, [{
+            'id': recipe.pk,
+            'author_id': recipe.author_id,
+            'pub_date': recipe.pub_date,
+        }])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние рецепты автора."""
+    recipes = get_recent_recipes(author_id)
+    if recipes:
+        create_items([user_id], recipes)
+
+
+def fan_out_author(author_id):
+    """Копирует последние рецепты автора в ленты всех его подписчиков.
+
+    Нужна, когда автор перестаёт быть популярным: его рецепты,
+    опубликованные за это время, в ленты не копировались.
+    """
+    recipes = get_recent_recipes(author_id)
+    if recipes:
+        create_items(
+            Subscription.objects.filter(
+                author_id=author_id
+            ).order_by().values_list('user_id', flat=True),
+            recipes
+        )
+
+
+def remove_author(user_id, author_id):
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def check_author(author_id):
+    """Перераспределяет ленту, если после отписки автор стал обычным."""
+    if CustomUser.objects.filter(
+        pk=author_id, subscribers_count=FEED_FANOUT_LIMIT
+    ).exists():
+        fan_out_author(author_id)
+
+
+def rebuild():
+    """Материализует ленты всех пользователей заново."""
+    FeedItem.objects.all().delete()
+    authors = list(CustomUser.objects.filter(
+        subscribers_count__gt=0,
+        subscribers_count__lte=FEED_FANOUT_LIMIT,
+        recipes_count__gt=0
+    ).values_list('pk', flat=True))
+    for author_id in authors:
+        fan_out_author(author_id)
+    return FeedItem.objects.count()
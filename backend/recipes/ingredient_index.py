@@ -0,0 +1,137 @@
+"""
+Индекс ингредиентов в памяти процесса для автодополнения.
+
+Справочник ингредиентов небольшой и меняется редко, поэтому каждый
+воркер держит его отсортированную копию и отвечает на поиск по префиксу
+двоичным поиском, не обращаясь к базе данных. Копия перестраивается,
+когда в общем кеше меняется версия каталога, строки для неё берутся
+из общего кеша.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from foodgram import cache
+from foodgram.constants import (
+    CATALOG_CACHE_TIMEOUT,
+    CATALOG_VERSION,
+    INGREDIENT_INDEX_TTL,
+)
+from recipes.models import Ingredient
+
+SEARCH_PREFIX = 'prefix'
+SEARCH_CONTAINS = 'contains'
+SEARCH_FUZZY = 'fuzzy'
+SEARCH_MODES = (SEARCH_PREFIX, SEARCH_CONTAINS, SEARCH_FUZZY)
+
+
+def normalize(value):
+    """Приводит строку к виду, в котором она хранится в индексе."""
+    return value.strip().casefold().replace('ё', 'е')
+
+
+def prefix_distance(query, name, max_distance):
+    """Расстояние Левенштейна от query до ближайшего префикса name.
+
+    Возвращает None, если расстояние больше max_distance.
+    """
+    name = name[:len(query) + max_distance]
+    letters = set(name)
+    if sum(char not in letters for char in query) > max_distance:
+        return None
+    previous = list(range(len(name) + 1))
+    for i, query_char in enumerate(query, 1):
+        current = [i]
+        for j, name_char in enumerate(name, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (query_char != name_char),
+            ))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    distance = min(previous)
+    return distance if distance <= max_distance else None
+
+
+class IngredientIndex:
+    """Отсортированный по названию снимок таблицы ингредиентов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._built_at = 0
+        self._version = None
+
+    def invalidate(self):
+        self._keys = None
+
+    def _load(self, version):
+        rows = cache.get_or_set(
+            cache.make_key('ingredients', version),
+            lambda: list(
+                Ingredient.objects.values('id', 'name', 'measurement_unit')
+            ),
+            CATALOG_CACHE_TIMEOUT
+        )
+        entries = sorted(
+            (normalize(row['name']), row['id'], row) for row in rows
+        )
+        return [key for key, _, _ in entries], [row for _, _, row in entries]
+
+    def _snapshot(self):
+        keys, items = self._keys, self._items
+        version = cache.get_version(CATALOG_VERSION)
+        if (
+            keys is None
+            or version != self._version
+            or time.monotonic() - self._built_at > INGREDIENT_INDEX_TTL
+        ):
+            with self._lock:
+                if self._keys is keys:
+                    self._keys, self._items = self._load(version)
+                    self._built_at = time.monotonic()
+                    self._version = version
+                keys, items = self._keys, self._items
+        return keys, items
+
+    def search(self, query, mode=SEARCH_PREFIX, limit=None):
+        """Возвращает ингредиенты, подходящие под запрос, по релевантности."""
+        keys, items = self._snapshot()
+        query = normalize(query)
+        if not query:
+            return items[:limit]
+
+        if mode == SEARCH_PREFIX:
+            start = bisect_left(keys, query)
+            result = []
+            for position in range(start, len(keys)):
+                if not keys[position].startswith(query):
+                    break
+                if limit is not None and len(result) >= limit:
+                    break
+                result.append(items[position])
+            return result
+
+        if mode == SEARCH_CONTAINS:
+            ranked = sorted(
+                (key.find(query), position)
+                for position, key in enumerate(keys)
+                if query in key
+            )
+        else:
+            max_distance = 1 if len(query) <= 4 else 2
+            ranked = []
+            for position, key in enumerate(keys):
+                distance = prefix_distance(query, key, max_distance)
+                if distance is not None:
+                    ranked.append(
+                        (distance, key[0] != query[0], position)
+                    )
+            ranked.sort()
+        return [items[rank[-1]] for rank in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
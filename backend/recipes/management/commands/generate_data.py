@@ -0,0 +1,274 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from PIL import Image
+
+from foodgram import cache
+from foodgram.constants import (
+    PANTRY_VERSION,
+    SYNTHETIC_USER_PASSWORD,
+    SYNTHETIC_USER_PREFIX,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from users.models import CustomUser, Subscription
+
+FIRST_NAMES = (
+    'Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий',
+)
+LAST_NAMES = (
+    'Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов',
+)
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Омлет', 'Рагу', 'Паста', 'Каша', 'Запеканка',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'летний', 'острый', 'праздничный', 'лёгкий',
+)
+WORDS = (
+    'нарезать', 'смешать', 'добавить', 'посолить', 'обжарить', 'варить',
+    'минут', 'на', 'среднем', 'огне', 'до', 'готовности', 'и', 'подавать',
+)
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+LINKS_PERIOD = 90 * 24 * 60 * 60
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса распределения Ципфа для random.choices."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических пользователей, рецептов, подписок, '
+        'избранного и списков покупок с неравномерной популярностью'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=10,
+            help='Среднее число подписок на пользователя'
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=20,
+            help='Среднее число рецептов в избранном у пользователя'
+        )
+        parser.add_argument(
+            '--cart',
+            type=int,
+            default=5,
+            help='Среднее число рецептов в списке покупок у пользователя'
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель распределения Ципфа для популярности'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--prefix',
+            default=SYNTHETIC_USER_PREFIX,
+            help='Префикс имён создаваемых пользователей'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        prefix = options['prefix']
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже существуют, '
+                'укажите другой --prefix'
+            )
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты командой load_ingredients'
+            )
+        self.rng.shuffle(ingredient_ids)
+        tag_ids = self.get_tag_ids()
+
+        user_ids = self.create_users(prefix, options['users'])
+        recipe_ids = self.create_recipes(
+            prefix, user_ids, options['recipes'], tag_ids, ingredient_ids
+        )
+        popular_recipes = recipe_ids[:]
+        self.rng.shuffle(popular_recipes)
+        links = (
+            (Subscription, 'author', user_ids, options['subscriptions']),
+            (Favorite, 'recipe', popular_recipes, options['favorites']),
+            (ShoppingCart, 'recipe', popular_recipes, options['cart']),
+        )
+        for model, field, targets, mean in links:
+            created = self.create_links(model, field, user_ids, targets, mean)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: создано {created}'
+            )
+        call_command(
+            'recount_counters',
+            batch_size=self.batch_size,
+            stdout=self.stdout
+        )
+        call_command(
+            'rebuild_search_index',
+            batch_size=self.batch_size,
+            stdout=self.stdout
+        )
+        call_command('rebuild_feed', stdout=self.stdout)
+        call_command('update_recipe_scores', full=True, stdout=self.stdout)
+        cache.bump_version(PANTRY_VERSION)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Создано {len(user_ids)} пользователей '
+                f'и {len(recipe_ids)} рецептов'
+            )
+        )
+
+    def get_tag_ids(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def save_image(self, prefix):
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), (200, 120, 60)).save(buffer, 'JPEG')
+        return default_storage.save(
+            f'recipes/{prefix}.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def text(self, length):
+        return ' '.join(self.rng.choices(WORDS, k=length)).capitalize()
+
+    def create_users(self, prefix, count):
+        password = make_password(SYNTHETIC_USER_PASSWORD)
+        user_ids = []
+        for start in range(0, count, self.batch_size):
+            users = CustomUser.objects.bulk_create(
+                CustomUser(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    password=password,
+                )
+                for number in range(start, min(start + self.batch_size, count))
+            )
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_recipes(self, prefix, user_ids, count, tag_ids, ingredient_ids):
+        image = self.save_image(prefix)
+        author_weights = zipf_weights(len(user_ids), self.skew)
+        ingredient_weights = zipf_weights(len(ingredient_ids), self.skew)
+        now = timezone.now()
+        recipe_ids = []
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=author_id,
+                    name=(
+                        f'{self.rng.choice(DISHES)} '
+                        f'{self.rng.choice(ADJECTIVES)} №{start + number}'
+                    ),
+                    image=image,
+                    text=self.text(self.rng.randint(10, 60)),
+                    cooking_time=self.rng.randint(5, 180),
+                )
+                for number, author_id in enumerate(self.rng.choices(
+                    user_ids, cum_weights=author_weights, k=size
+                ))
+            )
+            for recipe in recipes:
+                recipe.pub_date = now - timedelta(
+                    seconds=self.rng.randint(0, 365 * 24 * 60 * 60)
+                )
+            Recipe.objects.bulk_update(recipes, ['pub_date'])
+
+            recipe_tags = []
+            recipe_ingredients = []
+            for recipe in recipes:
+                for tag_id in self.rng.sample(
+                    tag_ids, self.rng.randint(1, min(3, len(tag_ids)))
+                ):
+                    recipe_tags.append(Recipe.tags.through(
+                        recipe_id=recipe.pk, tag_id=tag_id
+                    ))
+                for ingredient_id in set(self.rng.choices(
+                    ingredient_ids,
+                    cum_weights=ingredient_weights,
+                    k=self.rng.randint(3, 12)
+                )):
+                    recipe_ingredients.append(RecipeIngredient(
+                        recipe_id=recipe.pk,
+                        ingredient_id=ingredient_id,
+                        amount=self.rng.randint(1, 500),
+                    ))
+            Recipe.tags.through.objects.bulk_create(recipe_tags)
+            RecipeIngredient.objects.bulk_create(recipe_ingredients)
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+        return recipe_ids
+
+    def create_links(self, model, field, user_ids, targets, mean):
+        """Связи пользователей с популярными объектами, первые — чаще.
+
+        Избранное и списки покупок получают даты добавления
+        за последние LINKS_PERIOD секунд.
+        """
+        if not mean or not targets:
+            return 0
+        weights = zipf_weights(len(targets), self.skew)
+        now = timezone.now()
+        created = 0
+        batch = []
+        for user_id in user_ids:
+            count = min(int(self.rng.expovariate(1 / mean)), len(targets))
+            chosen = set(
+                self.rng.choices(targets, cum_weights=weights, k=count)
+            )
+            if model is Subscription:
+                chosen.discard(user_id)
+            for target in chosen:
+                link = model(user_id=user_id, **{f'{field}_id': target})
+                if model is not Subscription:
+                    link.created = now - timedelta(
+                        seconds=self.rng.randint(0, LINKS_PERIOD)
+                    )
+                batch.append(link)
+            if len(batch) >= self.batch_size:
+                created += len(model.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(model.objects.bulk_create(batch))
+        return created
@@ -1,7 +1,90 @@
-import json
 import csv
-from django.core.management.base import BaseCommand
+import io
+import json
+import re
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
 from recipes.models import Ingredient
+from recipes.signals import ingredients_imported
+
+READ_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json(file):
+    """Поочерёдно разбирает элементы JSON-массива, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов')
+    position = 1
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError(f'Некорректный JSON: {error}')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if isinstance(item, dict):
+            yield item.get('name'), item.get('measurement_unit')
+        else:
+            yield None, None
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield (row + [None])[:2]
+
+
+READERS = {
+    '.json': iter_json,
+    '.csv': iter_csv,
+}
+
+
+class RowStream(io.RawIOBase):
+    """Файлоподобная обёртка над строками CSV для COPY FROM STDIN."""
+
+    def __init__(self, rows):
+        self.lines = (
+            f'{line}\n'.encode() for line in self.iter_lines(rows)
+        )
+        self.rest = b''
+
+    @staticmethod
+    def iter_lines(rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='')
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.rest) < len(target):
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.rest += line
+        size = min(len(target), len(self.rest))
+        target[:size] = self.rest[:size]
+        self.rest = self.rest[size:]
+        return size
 
 
 class Command(BaseCommand):
@@ -13,52 +96,100 @@ class Command(BaseCommand):
             type=str,
             help='Путь к файлу с ингредиентами (JSON или CSV)'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество строк, вставляемых одним запросом'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY даже для PostgreSQL'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file_path']
-
-        if file_path.endswith('.json'):
-            self.load_from_json(file_path)
-        elif file_path.endswith('.csv'):
-            self.load_from_csv(file_path)
-        else:
+        extension = file_path[file_path.rfind('.'):].lower()
+        if extension not in READERS:
             self.stdout.write(
                 self.style.ERROR('Поддерживаются только JSON и CSV файлы')
             )
+            return
 
-    def load_from_json(self, file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            ingredients = [
-                Ingredient(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit']
-                )
-                for item in data
-            ]
-            Ingredient.objects.bulk_create(
-                ingredients,
-                ignore_conflicts=True
-            )
+        self.read = self.invalid = 0
+        started = time.monotonic()
+        with open(file_path, 'r', encoding='utf-8', newline='') as file:
+            rows = self.validate(READERS[extension](file))
+            if connection.vendor == 'postgresql' and not options['no_copy']:
+                inserted = self.copy(rows)
+            else:
+                inserted = self.insert(rows, options['batch_size'])
+        elapsed = max(time.monotonic() - started, 1e-6)
+        if inserted:
+            ingredients_imported.send(sender=Ingredient)
+
+        skipped = self.read - self.invalid - inserted
         self.stdout.write(
             self.style.SUCCESS(
-                f'Успешно загружено {len(ingredients)} ингредиентов из JSON'
+                f'Успешно загружено {inserted} ингредиентов из '
+                f'{extension[1:].upper()}: пропущено уже существующих '
+                f'{skipped}, некорректных {self.invalid}, '
+                f'{self.read / elapsed:.0f} строк/с'
             )
         )
 
-    def load_from_csv(self, file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            ingredients = [
-                Ingredient(name=row[0], measurement_unit=row[1])
-                for row in reader
-            ]
-            Ingredient.objects.bulk_create(
-                ingredients,
-                ignore_conflicts=True
+    def validate(self, rows):
+        name_length = Ingredient._meta.get_field('name').max_length
+        unit_length = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        for name, unit in rows:
+            self.read += 1
+            if (
+                not isinstance(name, str) or not isinstance(unit, str)
+                or not name or not unit
+                or len(name) > name_length or len(unit) > unit_length
+            ):
+                self.invalid += 1
+                continue
+            yield name, unit
+
+    def insert(self, rows, batch_size):
+        inserted = 0
+        while batch := dict.fromkeys(islice(rows, batch_size)):
+            existing = set(
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in batch}
+                ).values_list('name', 'measurement_unit')
             )
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Успешно загружено {len(ingredients)} ингредиентов из CSV'
+            with transaction.atomic():
+                created = Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in batch
+                        if (name, unit) not in existing
+                    ],
+                    ignore_conflicts=True
+                )
+            inserted += len(created)
+        return inserted
+
+    def copy(self, rows):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
             )
-        )
+            cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                RowStream(rows)
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестроение лент подписок: последние рецепты обычных авторов '
+        'копируются в ленты их подписчиков'
+    )
+
+    def handle(self, *args, **options):
+        total = feed.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Записей в лентах: {total}')
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.constants import SEARCH_INDEX_BATCH_SIZE
+from recipes.models import Recipe
+from recipes.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Перестроение поисковых документов всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=SEARCH_INDEX_BATCH_SIZE,
+            help='Количество рецептов, индексируемых за один проход'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        recipe_ids = Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True
+        )
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(recipe_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            index_recipes(batch)
+            total += len(batch)
+            last_id = batch[-1]
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано рецептов: {total}')
+        )
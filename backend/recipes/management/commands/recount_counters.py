@@ -0,0 +1,76 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import CustomUser, Subscription
+
+
+def count_of(queryset, field):
+    """Подзапрос с количеством строк queryset, ссылающихся на объект."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт денормализованных счётчиков рецептов и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество объектов, обновляемых одним запросом'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        counters = (
+            (Recipe, {
+                'favorites_count': count_of(Favorite.objects, 'recipe'),
+                'shopping_cart_count': count_of(
+                    ShoppingCart.objects, 'recipe'
+                ),
+            }),
+            (CustomUser, {
+                'recipes_count': count_of(Recipe.objects, 'author'),
+                'subscribers_count': count_of(
+                    Subscription.objects, 'author'
+                ),
+            }),
+        )
+        for model, fields in counters:
+            fixed = self.recount(model, fields, batch_size)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{model._meta.verbose_name_plural}: '
+                    f'исправлено {fixed} объектов'
+                )
+            )
+
+    def recount(self, model, fields, batch_size):
+        stale = model.objects.annotate(**{
+            f'actual_{field}': expression
+            for field, expression in fields.items()
+        }).filter(reduce(or_, (
+            ~Q(**{field: F(f'actual_{field}')}) for field in fields
+        )))
+        pks = list(stale.values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            with transaction.atomic():
+                model.objects.filter(
+                    pk__in=pks[start:start + batch_size]
+                ).update(**fields)
+        return len(pks)
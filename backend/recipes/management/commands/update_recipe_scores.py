@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from foodgram import cache
+from recipes import ranking
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновление оценок рецептов для сортировок popular и trending; '
+        'запускается периодически'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать оценки всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        if cache.is_process_local():
+            self.stderr.write(self.style.WARNING(
+                'Кеш виден только этому процессу (CACHE_BACKEND=locmem): '
+                'отметка пересчёта и сброс кешей не дойдут до воркеров '
+                'приложения, задайте общий кеш, например CACHE_BACKEND=redis'
+            ))
+        total = ranking.refresh(full=options['full'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано оценок: {total}')
+        )
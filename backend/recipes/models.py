@@ -1,16 +1,21 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 from foodgram.constants import (
+    MAX_LENGTH_FILE_NAME,
     MAX_LENGTH_INGREDIENT_NAME,
     MAX_LENGTH_INGREDIENT_UNIT,
     MAX_LENGTH_RECIPE_NAME,
+    MAX_LENGTH_SEARCH_TERM,
     MAX_LENGTH_TAG_NAME,
     MAX_LENGTH_TAG_SLUG,
     MIN_COOKING_TIME,
     MIN_INGREDIENT_AMOUNT,
 )
-from users.models import CustomUser
+from users.models import CounterFieldsMixin, CustomUser, Subscription
 
 
 class Tag(models.Model):
@@ -63,9 +68,60 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+def get_recipe_related_lookups():
+    """Связи, нужные для полного представления рецепта.
+
+    Число запросов при их подгрузке не зависит от количества рецептов.
+    """
+    return (
+        'author',
+        'tags',
+        models.Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов."""
+
+    def with_user_flags(self, user):
+        """Аннотирует is_favorited, is_in_shopping_cart и подписку на автора.
+
+        Флаги зависят от пользователя и не попадают в кеш представлений.
+        """
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_subscribed_to_author=models.Exists(
+                Subscription.objects.filter(
+                    user=user,
+                    author=models.OuterRef('author')
+                )
+            ),
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk')
+            )),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецептов."""
 
+    counter_fields = (
+        'favorites_count',
+        'shopping_cart_count',
+        'popular_score',
+        'trending_score',
+        'image_variants_name',
+    )
+
     author = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -80,6 +136,12 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='recipes/',
     )
+    image_variants_name = models.CharField(
+        'Изображение с построенными копиями',
+        max_length=MAX_LENGTH_FILE_NAME,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Описание',
     )
@@ -100,11 +162,55 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    popular_score = models.PositiveIntegerField(
+        'Популярность',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        'Оценка в трендах',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-popular_score', '-id'],
+                name='recipe_popular_score_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_score_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -158,6 +264,11 @@ class AbstractUserRecipe(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now,
+        db_index=True,
+    )
 
     class Meta:
         abstract = True
@@ -230,3 +341,127 @@ class ShoppingCart(AbstractUserRecipe):
             f'{self.user.username} '
             f'добавил {self.recipe.name} в список покупок'
         )
+
+
+class SearchVectorIndex(GinIndex):
+    """GIN-индекс, на базах кроме PostgreSQL — обычный индекс.
+
+    Индекс объявлен для всех баз, поэтому миграция не зависит от того,
+    на какой базе её создали.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        return models.Index.create_sql(self, model, schema_editor, **kwargs)
+
+
+class RecipeSearchDocument(models.Model):
+    """Поисковый документ рецепта для PostgreSQL.
+
+    tsvector из названия (вес A), названий ингредиентов (B) и описания (C)
+    с GIN-индексом. На других базах не заполняется.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name='Рецепт',
+    )
+    vector = SearchVectorField(null=True)
+
+    class Meta:
+        verbose_name = 'Поисковый документ рецепта'
+        verbose_name_plural = 'Поисковые документы рецептов'
+        indexes = [
+            SearchVectorIndex(
+                fields=['vector'], name='recipe_search_vector_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.recipe)
+
+
+class RecipeSearchTerm(models.Model):
+    """Инвертированный индекс рецептов для баз без полнотекстового поиска.
+
+    Строка — основа слова из рецепта и её вес: сумма весов полей,
+    в которых она встречается.
+    """
+
+    term = models.CharField(
+        'Основа слова',
+        max_length=MAX_LENGTH_SEARCH_TERM,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Рецепт',
+    )
+    weight = models.PositiveSmallIntegerField('Вес')
+
+    class Meta:
+        verbose_name = 'Поисковый терм рецепта'
+        verbose_name_plural = 'Поисковые термы рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'recipe'],
+                name='unique_recipe_search_term'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.term} в {self.recipe_id}'
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок: рецепт автора, на которого подписан user.
+
+    Записи создаются при публикации рецепта (fan-out on write) для всех
+    авторов, кроме популярных, чьи рецепты лента читает при запросе.
+    Дата публикации продублирована, чтобы страница ленты читалась
+    по индексу без соединения с таблицей рецептов.
+    """
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} в ленте {self.user_id}'
@@ -0,0 +1,393 @@
+"""
+Подбор рецептов по продуктам, которые есть у пользователя.
+
+Каждый воркер держит в памяти инвертированный индекс ингредиент →
+рецепты. Множество рецептов ингредиента хранится компактнее из двух
+видов: редкого — отсортированным массивом id (array), частого — битовой
+картой в целом числе, где номер бита равен id рецепта. Числа
+ингредиентов рецептов хранятся побитовыми срезами: k-я карта отмечает
+рецепты, у которых в этом числе выставлен k-й бит.
+
+Запрос не обращается к базе данных и не перебирает рецепты по одному:
+карты ингредиентов складываются как двоичные числа по срезам, разность
+с числом ингредиентов рецепта даёт недостающие, а маски групп рецептов
+с равными числами недостающих и имеющихся получаются поразрядными
+операциями над большими целыми.
+
+Индекс обновляется по журналу изменений в общем кеше: после фиксации
+транзакции id изменённых рецептов записываются под очередным номером,
+и воркер перечитывает из базы только их. Если журнал неполон или
+сменилась версия индекса (bump_version), индекс строится заново.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import zip_longest
+
+from foodgram import cache
+from foodgram.constants import (
+    PANTRY_BATCH_SIZE,
+    PANTRY_CHANGES_TIMEOUT,
+    PANTRY_INDEX_TTL,
+    PANTRY_MAX_CHANGES,
+    PANTRY_VERSION,
+)
+from foodgram.on_commit import OnCommitBatch
+from recipes.models import RecipeIngredient
+
+
+def get_counter_key(version):
+    return cache.make_key('pantry', version, 'last')
+
+
+def get_changes_key(version, number):
+    return cache.make_key('pantry', version, number)
+
+
+def publish_changes(recipe_ids):
+    """Записывает id изменённых рецептов в журнал индекса."""
+    version = cache.get_version(PANTRY_VERSION)
+    number = cache.incr(get_counter_key(version))
+    cache.set_many(
+        {get_changes_key(version, number): list(recipe_ids)},
+        PANTRY_CHANGES_TIMEOUT
+    )
+
+
+change_publishing = OnCommitBatch(publish_changes)
+
+
+def publish_changes_on_commit(recipe_ids):
+    """Записывает изменения после фиксации транзакции, одним вызовом."""
+    change_publishing.add(recipe_ids)
+
+
+def get_changes(version, since):
+    """Id рецептов из записей журнала после номера since.
+
+    Возвращает пару (номер последней записи, id) или None, если записи
+    вытеснены из кеша или их слишком много и дешевле построить индекс
+    заново.
+    """
+    last = cache.get(get_counter_key(version), 0)
+    if last < since or last - since > PANTRY_MAX_CHANGES:
+        return None
+    if last == since:
+        return last, set()
+    keys = [
+        get_changes_key(version, number)
+        for number in range(since + 1, last + 1)
+    ]
+    entries = cache.get_many(keys)
+    if len(entries) < len(keys):
+        return None
+    return last, {
+        recipe_id for recipe_ids in entries.values()
+        for recipe_id in recipe_ids
+    }
+
+
+def load_ingredients(recipe_ids=None):
+    """Словарь {id рецепта: [id ингредиентов]} из базы данных."""
+    queryset = RecipeIngredient.objects.order_by().values_list(
+        'recipe_id', 'ingredient_id'
+    )
+    recipes = defaultdict(list)
+    if recipe_ids is None:
+        batches = [queryset.iterator(chunk_size=PANTRY_BATCH_SIZE)]
+    else:
+        recipe_ids = list(recipe_ids)
+        batches = (
+            queryset.filter(
+                recipe_id__in=recipe_ids[start:start + PANTRY_BATCH_SIZE]
+            )
+            for start in range(0, len(recipe_ids), PANTRY_BATCH_SIZE)
+        )
+    for batch in batches:
+        for recipe_id, ingredient_id in batch:
+            recipes[recipe_id].append(ingredient_id)
+    return recipes
+
+
+def make_bitmap(positions):
+    """Битовая карта с единицами в позициях positions."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    buffer = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def to_bitmap(posting):
+    return posting if isinstance(posting, int) else make_bitmap(posting)
+
+
+def add_recipe(posting, recipe_id):
+    if isinstance(posting, int):
+        return posting | 1 << recipe_id
+    posting = array('q', posting)
+    insort(posting, recipe_id)
+    return posting
+
+
+def remove_recipe(posting, recipe_id):
+    if isinstance(posting, int):
+        bit = 1 << recipe_id
+        return posting ^ (posting & bit)
+    posting = array('q', posting)
+    position = bisect_left(posting, recipe_id)
+    if position < len(posting) and posting[position] == recipe_id:
+        del posting[position]
+    return posting
+
+
+def add_bitmap(planes, bitmap):
+    """Прибавляет к числам в срезах planes единицы из карты bitmap."""
+    carry = bitmap
+    for index, plane in enumerate(planes):
+        if not carry:
+            return
+        planes[index], carry = plane ^ carry, plane & carry
+    if carry:
+        planes.append(carry)
+
+
+def subtract(minuend, subtrahend):
+    """Поразрядная разность чисел в срезах, вычитаемое не больше."""
+    result = []
+    borrow = 0
+    for left, right in zip_longest(minuend, subtrahend, fillvalue=0):
+        result.append(left ^ right ^ borrow)
+        borrow = (~left & right) | (~(left ^ right) & borrow)
+    return result
+
+
+def equal(planes, value, within):
+    """Часть карты within, где число в срезах planes равно value."""
+    if value >> len(planes):
+        return 0
+    for index, plane in enumerate(planes):
+        if value >> index & 1:
+            within &= plane
+        else:
+            within ^= within & plane
+        if not within:
+            break
+    return within
+
+
+def iter_bits(bitmap, skip, limit):
+    """Номера единичных битов карты по убыванию, с пропуском первых skip."""
+    digits = bin(bitmap)
+    index = 1
+    while limit > 0:
+        index = digits.find('1', index + 1)
+        if index < 0:
+            return
+        if skip:
+            skip -= 1
+            continue
+        limit -= 1
+        yield len(digits) - 1 - index
+
+
+class PantryMatches:
+    """Результат подбора в порядке выдачи.
+
+    Хранит группы рецептов с равными числами недостающих и имеющихся
+    ингредиентов и разворачивает в кортежи (id рецепта, недостаёт,
+    имеется) только запрошенный срез, поэтому подходит для Paginator.
+    У группы рецептов без недостающих число имеющихся не задано и берётся
+    из recipes.
+    """
+
+    def __init__(self, groups, recipes):
+        self.groups = groups
+        self.recipes = recipes
+
+    def __len__(self):
+        return sum(count for _, _, _, count in self.groups)
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(len(self))
+        limit = stop - start
+        result = []
+        for missing, found, bitmap, count in self.groups:
+            if len(result) >= limit:
+                break
+            if start >= count:
+                start -= count
+                continue
+            result.extend(
+                (
+                    recipe_id,
+                    missing,
+                    len(self.recipes[recipe_id]) if found is None else found
+                )
+                for recipe_id in iter_bits(
+                    bitmap, start, limit - len(result)
+                )
+            )
+            start = 0
+        return result
+
+
+class PantryIndex:
+    """Инвертированный индекс ингредиент → рецепты."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._built_at = 0
+
+    def invalidate(self):
+        self._state = None
+
+    def _build(self, version):
+        last = cache.get(get_counter_key(version), 0)
+        recipes = load_ingredients()
+        postings = defaultdict(list)
+        for recipe_id in sorted(recipes):
+            for ingredient_id in recipes[recipe_id]:
+                postings[ingredient_id].append(recipe_id)
+        # Карта занимает max_id / 8 байт, массив — 8 байт на рецепт.
+        max_id = max(recipes, default=0)
+        sizes = [
+            make_bitmap(
+                recipe_id for recipe_id, ingredient_ids in recipes.items()
+                if len(ingredient_ids) >> index & 1
+            )
+            for index in range(
+                max(map(len, recipes.values()), default=0).bit_length()
+            )
+        ]
+        return {
+            'version': version,
+            'last': last,
+            'postings': {
+                ingredient_id: (
+                    make_bitmap(recipe_ids)
+                    if len(recipe_ids) * 64 > max_id
+                    else array('q', recipe_ids)
+                )
+                for ingredient_id, recipe_ids in postings.items()
+            },
+            'recipes': {
+                recipe_id: tuple(ingredient_ids)
+                for recipe_id, ingredient_ids in recipes.items()
+            },
+            'sizes': sizes,
+        }
+
+    def _apply(self, state, last, recipe_ids):
+        """Копия состояния с перечитанными из базы рецептами recipe_ids.
+
+        Затронутые множества заменяются новыми объектами, поэтому
+        запросы, читающие прежнее состояние, не видят изменений.
+        """
+        current = load_ingredients(recipe_ids)
+        postings = dict(state['postings'])
+        recipes = dict(state['recipes'])
+        sizes = list(state['sizes'])
+        for recipe_id in recipe_ids:
+            old = set(recipes.pop(recipe_id, ()))
+            new = set(current.get(recipe_id, ()))
+            for ingredient_id in old - new:
+                posting = remove_recipe(postings[ingredient_id], recipe_id)
+                if posting:
+                    postings[ingredient_id] = posting
+                else:
+                    del postings[ingredient_id]
+            for ingredient_id in new - old:
+                postings[ingredient_id] = add_recipe(
+                    postings.get(ingredient_id, array('q')), recipe_id
+                )
+            if new:
+                recipes[recipe_id] = tuple(new)
+            bit = 1 << recipe_id
+            sizes.extend([0] * (len(new).bit_length() - len(sizes)))
+            sizes = [
+                (plane ^ (plane & bit))
+                | (bit if len(new) >> index & 1 else 0)
+                for index, plane in enumerate(sizes)
+            ]
+        return {
+            **state,
+            'last': last,
+            'postings': postings,
+            'recipes': recipes,
+            'sizes': sizes,
+        }
+
+    def _is_fresh(self, state, version):
+        return (
+            state is not None
+            and state['version'] == version
+            and time.monotonic() - self._built_at <= PANTRY_INDEX_TTL
+        )
+
+    def _snapshot(self):
+        state = self._state
+        version = cache.get_version(PANTRY_VERSION)
+        fresh = self._is_fresh(state, version)
+        if fresh and cache.get(get_counter_key(version), 0) == state['last']:
+            return state
+        with self._lock:
+            if self._state is state:
+                changes = fresh and get_changes(version, state['last'])
+                if not changes:
+                    self._state = self._build(version)
+                    self._built_at = time.monotonic()
+                else:
+                    self._state = self._apply(state, *changes)
+            return self._state
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Порядок: по возрастанию числа недостающих ингредиентов, затем
+        по убыванию доли имеющихся и от новых рецептов к старым. При
+        равном ненулевом числе недостающих доля тем больше, чем больше
+        имеющихся, поэтому группы достаточно упорядочить по этому числу.
+        Без недостающих доля у всех рецептов равна 1, и они образуют одну
+        группу.
+        """
+        state = self._snapshot()
+        bitmaps = [
+            to_bitmap(state['postings'][ingredient_id])
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in state['postings']
+        ]
+        found_planes = []
+        remaining = 0
+        for bitmap in bitmaps:
+            remaining |= bitmap
+            add_bitmap(found_planes, bitmap)
+        missing_planes = subtract(state['sizes'], found_planes)
+
+        groups = []
+        missing = 0
+        while remaining and (max_missing is None or missing <= max_missing):
+            group = equal(missing_planes, missing, remaining)
+            remaining ^= group
+            if group and not missing:
+                groups.append((missing, None, group, group.bit_count()))
+                group = 0
+            found = len(bitmaps)
+            while group:
+                subgroup = equal(found_planes, found, group)
+                if subgroup:
+                    groups.append(
+                        (missing, found, subgroup, subgroup.bit_count())
+                    )
+                    group ^= subgroup
+                found -= 1
+            missing += 1
+        return PantryMatches(groups, state['recipes'])
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,127 @@
+"""
+Рейтинги рецептов для сортировок popular и trending.
+
+popular_score — взвешенное число добавлений рецепта в избранное и в списки
+покупок. trending_score — та же сумма, в которой вклад добавления убывает
+вдвое за RANKING_TRENDING_HALF_LIFE. Затухание прямое (forward decay):
+вместо уменьшения старых вкладов вес добавления растёт со временем как
+2^(t / half_life), порядок рецептов от этого не меняется, поэтому оценки
+рецептов без новых добавлений пересчитывать не нужно. Хранится двоичный
+логарифм суммы, чтобы она не переполнялась.
+
+Оценки обновляет периодическая команда update_recipe_scores. Она
+пересчитывает только рецепты, у которых счётчики разошлись с
+popular_score (добавления и удаления), и рецепты с добавлениями после
+прошлого запуска, время которого хранится в кеше. Если его там нет,
+пересчитываются все рецепты.
+"""
+import math
+from collections import defaultdict
+
+from django.db.models import F
+from django.utils import timezone
+
+from foodgram import cache
+from foodgram.constants import (
+    RANKING_BATCH_SIZE,
+    RANKING_FAVORITE_WEIGHT,
+    RANKING_SHOPPING_CART_WEIGHT,
+    RANKING_TRENDING_HALF_LIFE,
+)
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+SOURCES = (
+    (Favorite, RANKING_FAVORITE_WEIGHT),
+    (ShoppingCart, RANKING_SHOPPING_CART_WEIGHT),
+)
+
+
+def get_last_run_key():
+    return cache.make_key('ranking', 'last_run')
+
+
+def get_popular_score():
+    """Выражение popular_score по счётчикам рецепта."""
+    return (
+        F('favorites_count') * RANKING_FAVORITE_WEIGHT
+        + F('shopping_cart_count') * RANKING_SHOPPING_CART_WEIGHT
+    )
+
+
+def log2_sum(exponents):
+    """log2(сумма 2^e) без переполнения."""
+    high = max(exponents)
+    return high + math.log2(sum(2 ** (value - high) for value in exponents))
+
+
+def get_trending_scores(recipe_ids):
+    """Словарь {id рецепта: trending_score} для рецептов с добавлениями."""
+    exponents = defaultdict(list)
+    for model, weight in SOURCES:
+        offset = math.log2(weight)
+        for recipe_id, created in model.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list('recipe_id', 'created'):
+            exponents[recipe_id].append(
+                created.timestamp() / RANKING_TRENDING_HALF_LIFE + offset
+            )
+    return {
+        recipe_id: log2_sum(values)
+        for recipe_id, values in exponents.items()
+    }
+
+
+def get_changed_recipes(since):
+    """Id рецептов, оценки которых могли устареть после момента since."""
+    changed = set(Recipe.objects.exclude(
+        popular_score=get_popular_score()
+    ).order_by().values_list('pk', flat=True))
+    for model, _ in SOURCES:
+        changed.update(model.objects.filter(
+            created__gte=since
+        ).order_by().values_list('recipe_id', flat=True))
+    return changed
+
+
+def update_scores(recipe_ids):
+    """Пересчитывает оценки рецептов пачками, записывает изменившиеся."""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), RANKING_BATCH_SIZE):
+        current = {
+            recipe_id: (popular, (old_popular, old_trending))
+            for recipe_id, popular, old_popular, old_trending
+            in Recipe.objects.filter(
+                pk__in=recipe_ids[start:start + RANKING_BATCH_SIZE]
+            ).order_by().values_list(
+                'pk', get_popular_score(), 'popular_score', 'trending_score'
+            )
+        }
+        trending = get_trending_scores(list(current))
+        changed = []
+        for recipe_id, (popular, old) in current.items():
+            scores = (popular, trending.get(recipe_id, 0))
+            if scores != old:
+                changed.append(Recipe(
+                    pk=recipe_id,
+                    popular_score=scores[0],
+                    trending_score=scores[1],
+                ))
+        Recipe.objects.bulk_update(
+            changed,
+            ['popular_score', 'trending_score'],
+            batch_size=RANKING_BATCH_SIZE
+        )
+
+
+def refresh(full=False):
+    """Обновляет устаревшие оценки, возвращает число пересчитанных."""
+    started = timezone.now()
+    since = None if full else cache.get(get_last_run_key())
+    if since is None:
+        recipe_ids = Recipe.objects.order_by().values_list('pk', flat=True)
+    else:
+        recipe_ids = get_changed_recipes(since)
+    recipe_ids = list(recipe_ids)
+    update_scores(recipe_ids)
+    cache.set_many({get_last_run_key(): started}, None)
+    return len(recipe_ids)
@@ -0,0 +1,162 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+В PostgreSQL у рецепта есть RecipeSearchDocument: tsvector в
+конфигурации russian с весами полей и GIN-индексом, результаты
+ранжируются ts_rank. На других базах (SQLite) документ раскладывается
+стеммером Snowball на основы слов в инвертированный индекс
+RecipeSearchTerm, а ранг — сумма весов найденных основ. Документы
+перестраиваются после фиксации транзакций, меняющих рецепт, его
+ингредиенты или их названия.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+
+from foodgram.constants import (
+    MAX_LENGTH_SEARCH_TERM,
+    SEARCH_CONFIG,
+    SEARCH_INDEX_BATCH_SIZE,
+    SEARCH_MAX_TERMS,
+    SEARCH_STOP_WORDS,
+    SEARCH_TERM_WEIGHTS,
+    SEARCH_WEIGHTS,
+)
+from foodgram.on_commit import OnCommitBatch
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeSearchDocument,
+    RecipeSearchTerm,
+)
+from recipes.stemmer import stem
+
+WORD = re.compile(r'[0-9a-zа-я]+')
+
+POSTGRESQL_INDEX_SQL = '''
+    INSERT INTO {document} (recipe_id, vector)
+    SELECT
+        recipe.id,
+        setweight(to_tsvector(%(config)s, recipe.name), %(name)s)
+        || setweight(to_tsvector(
+            %(config)s, coalesce(string_agg(ingredient.name, ' '), '')
+        ), %(ingredients)s)
+        || setweight(to_tsvector(%(config)s, recipe.text), %(text)s)
+    FROM {recipe} AS recipe
+    LEFT JOIN {link} AS link ON link.recipe_id = recipe.id
+    LEFT JOIN {ingredient} AS ingredient
+        ON ingredient.id = link.ingredient_id
+    WHERE recipe.id = ANY(%(ids)s)
+    GROUP BY recipe.id
+    ON CONFLICT (recipe_id) DO UPDATE SET vector = EXCLUDED.vector
+'''
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    """Основы значимых слов текста."""
+    for word in WORD.findall(text.casefold().replace('ё', 'е')):
+        if len(word) > 1 and word not in SEARCH_STOP_WORDS:
+            yield stem(word)[:MAX_LENGTH_SEARCH_TERM]
+
+
+def get_term_weights(fields):
+    """Веса основ документа: сумма весов полей, где основа встречается."""
+    weights = {}
+    for field, text in fields.items():
+        weight = SEARCH_TERM_WEIGHTS[SEARCH_WEIGHTS[field]]
+        for term in set(tokenize(text)):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+def index_recipes(recipe_ids):
+    """Перестраивает поисковые документы рецептов."""
+    recipe_ids = list(recipe_ids)
+    index = index_documents if is_postgresql() else index_terms
+    for start in range(0, len(recipe_ids), SEARCH_INDEX_BATCH_SIZE):
+        index(recipe_ids[start:start + SEARCH_INDEX_BATCH_SIZE])
+
+
+def index_documents(recipe_ids):
+    sql = POSTGRESQL_INDEX_SQL.format(
+        document=RecipeSearchDocument._meta.db_table,
+        recipe=Recipe._meta.db_table,
+        link=RecipeIngredient._meta.db_table,
+        ingredient=Ingredient._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'config': SEARCH_CONFIG,
+            'ids': list(recipe_ids),
+            **SEARCH_WEIGHTS,
+        })
+
+
+def index_terms(recipe_ids):
+    documents = {
+        recipe['id']: {
+            'name': recipe['name'],
+            'ingredients': [],
+            'text': recipe['text'],
+        }
+        for recipe in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).order_by().values('id', 'name', 'text')
+    }
+    for recipe_id, name in RecipeIngredient.objects.filter(
+        recipe_id__in=documents
+    ).order_by().values_list('recipe_id', 'ingredient__name'):
+        documents[recipe_id]['ingredients'].append(name)
+    with transaction.atomic():
+        RecipeSearchTerm.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSearchTerm.objects.bulk_create(
+            RecipeSearchTerm(recipe_id=recipe_id, term=term, weight=weight)
+            for recipe_id, fields in documents.items()
+            for term, weight in get_term_weights({
+                **fields, 'ingredients': ' '.join(fields['ingredients'])
+            }).items()
+        )
+
+
+recipe_indexing = OnCommitBatch(index_recipes)
+
+
+def index_recipes_on_commit(recipe_ids):
+    """Перестраивает документы после фиксации транзакции, одним проходом."""
+    recipe_indexing.add(recipe_ids)
+
+
+def search_recipes(queryset, query):
+    """Рецепты queryset, подходящие под запрос, по убыванию релевантности.
+
+    Рецепт подходит, если содержит все значимые слова запроса.
+    """
+    if is_postgresql():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        queryset = queryset.filter(
+            search_document__vector=search_query
+        ).annotate(search_rank=SearchRank(
+            F('search_document__vector'), search_query
+        ))
+    else:
+        terms = list(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_TERMS]
+        if not terms:
+            return queryset.none()
+        matches = RecipeSearchTerm.objects.filter(
+            term__in=terms
+        ).values('recipe').annotate(
+            found=Count('term'), rank=Sum('weight')
+        )
+        queryset = queryset.filter(
+            pk__in=matches.filter(found=len(terms)).values('recipe')
+        ).annotate(search_rank=Subquery(
+            matches.filter(recipe=OuterRef('pk')).values('rank')
+        ))
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,116 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from recipes import feed
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from recipes.pantry import publish_changes_on_commit
+from recipes.search import index_recipes_on_commit
+from users.models import CustomUser, Subscription
+
+ingredients_imported = Signal()
+
+# (модель строки, модель со счётчиком, поле ссылки, счётчик)
+COUNTERS = (
+    (Favorite, Recipe, 'recipe_id', 'favorites_count'),
+    (ShoppingCart, Recipe, 'recipe_id', 'shopping_cart_count'),
+    (Recipe, CustomUser, 'author_id', 'recipes_count'),
+    (Subscription, CustomUser, 'author_id', 'subscribers_count'),
+)
+
+
+def update_counter(model, pk, field, delta):
+    """Атомарно изменяет счётчик в базе данных."""
+    model._default_manager.filter(pk=pk).update(
+        **{field: F(field) + delta}
+    )
+
+
+def connect_counter(sender, model, link, field):
+    """Поддерживает счётчик field при создании и удалении строк sender.
+
+    Обработчики выполняются в транзакции сохранения или удаления, поэтому
+    счётчик верен и при изменениях из админки, каскадном удалении
+    и любой другой записи через ORM.
+    """
+    def increment(instance, created, raw=False, **kwargs):
+        if created and not raw:
+            update_counter(model, getattr(instance, link), field, 1)
+
+    def decrement(instance, **kwargs):
+        update_counter(model, getattr(instance, link), field, -1)
+
+    post_save.connect(
+        increment, sender=sender, weak=False, dispatch_uid=f'{field}+'
+    )
+    post_delete.connect(
+        decrement, sender=sender, weak=False, dispatch_uid=f'{field}-'
+    )
+
+
+for counter in COUNTERS:
+    connect_counter(*counter)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver(ingredients_imported)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(instance, **kwargs):
+    index_recipes_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def index_recipe_ingredients(instance, **kwargs):
+    index_recipes_on_commit([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        index_recipes_on_commit(
+            instance.recipe_ingredients.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def update_pantry_recipe(instance, **kwargs):
+    publish_changes_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def update_pantry_recipe_ingredients(instance, **kwargs):
+    publish_changes_on_commit([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(feed.fan_out_recipe, instance))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            partial(feed.backfill, instance.user_id, instance.author_id)
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_feed(instance, **kwargs):
+    feed.remove_author(instance.user_id, instance.author_id)
+    transaction.on_commit(partial(feed.check_author, instance.author_id))
@@ -0,0 +1,122 @@
+"""
+Стеммер русского языка по алгоритму Snowball (Портера).
+
+Используется поисковым индексом рецептов на базах без полнотекстового
+поиска; в PostgreSQL ту же работу делает конфигурация russian.
+"""
+VOWELS = 'аеиоуыэюя'
+PRECEDING = 'ая'
+
+
+def endings(*groups):
+    """Окончания групп по убыванию длины.
+
+    Каждая группа — строка окончаний и признак того, что перед окончанием
+    должна стоять «а» или «я».
+    """
+    return sorted(
+        (
+            (ending, preceded)
+            for group, preceded in groups
+            for ending in group.split()
+        ),
+        key=lambda item: -len(item[0])
+    )
+
+
+PERFECTIVE_GERUND = endings(
+    ('в вши вшись', True),
+    ('ив ивши ившись ыв ывши ывшись', False),
+)
+ADJECTIVE = endings((
+    'ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых '
+    'ую юю ая яя ою ею',
+    False
+))
+PARTICIPLE = endings(
+    ('ем нн вш ющ щ', True),
+    ('ивш ывш ующ', False),
+)
+REFLEXIVE = endings(('ся сь', False))
+VERB = endings(
+    ('ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно', True),
+    (
+        'ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло '
+        'ено ят ует уют ит ыт ены ить ыть ишь ую ю',
+        False
+    ),
+)
+NOUN = endings((
+    'а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем '
+    'ам ом о у ах иях ях ы ь ию ью ю ия ья я',
+    False
+))
+SUPERLATIVE = endings(('ейш ейше', False))
+DERIVATIONAL = endings(('ост ость', False))
+
+
+def regions(word):
+    """Начала областей RV и R2 алгоритма."""
+    rv = next(
+        (index + 1 for index, char in enumerate(word) if char in VOWELS),
+        len(word)
+    )
+    r1 = after_syllable(word, 0)
+    return rv, after_syllable(word, r1)
+
+
+def after_syllable(word, start):
+    """Позиция после первой согласной, следующей за гласной."""
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def strip(word, start, group):
+    """Отрезает самое длинное окончание group не левее start.
+
+    Возвращает None, если окончание не найдено или не выполнено условие
+    на предшествующую букву.
+    """
+    for ending, preceded in group:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if preceded and not (
+                len(stem) > start and stem[-1] in PRECEDING
+            ):
+                return None
+            return stem
+    return None
+
+
+def stem(word):
+    """Основа слова; слово должно быть в нижнем регистре, «ё» как «е»."""
+    rv, r2 = regions(word)
+
+    stemmed = strip(word, rv, PERFECTIVE_GERUND)
+    if stemmed is None:
+        word = strip(word, rv, REFLEXIVE) or word
+        stemmed = strip(word, rv, ADJECTIVE)
+        if stemmed is not None:
+            stemmed = strip(stemmed, rv, PARTICIPLE) or stemmed
+        else:
+            stemmed = strip(word, rv, VERB)
+            if stemmed is None:
+                stemmed = strip(word, rv, NOUN)
+    if stemmed is not None:
+        word = stemmed
+
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+
+    word = strip(word, r2, DERIVATIONAL) or word
+
+    stemmed = strip(word, rv, SUPERLATIVE)
+    if stemmed is not None:
+        word = stemmed
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    elif stemmed is None and word.endswith('ь') and len(word) > rv:
+        word = word[:-1]
+    return word
@@ -0,0 +1,171 @@
+import random
+from array import array
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.pantry import PantryIndex
+from users.models import CustomUser
+
+ISOLATED_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipes-tests',
+    }
+}
+
+
+@override_settings(CACHES=ISOLATED_CACHE)
+class PantryIndexTest(TestCase):
+    """Подбор по продуктам совпадает с полным перебором рецептов.
+
+    Ожидаемый порядок: по возрастанию числа недостающих ингредиентов,
+    по убыванию доли имеющихся, от новых рецептов к старым.
+    """
+
+    seed = 20240601
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(mock.patch('api.images.submit'))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_data()
+
+    @classmethod
+    def create_data(cls):
+        cls.random = random.Random(cls.seed)
+        cls.author = CustomUser.objects.create_user(
+            username='author', email='author@example.com'
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(14)
+        )
+        # Рецепты частых ингредиентов хранятся битовыми картами, двух
+        # редких, по рецепту у каждого, — массивами.
+        common, cls.rare = cls.ingredients[:12], cls.ingredients[12:]
+        for number in range(120):
+            recipe = cls.create_recipe(number)
+            ingredients = common[:6] if number % 2 else common
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in cls.random.sample(
+                    ingredients, cls.random.randint(1, 5)
+                )
+            )
+            if number < len(cls.rare):
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=cls.rare[number], amount=1
+                )
+
+    @classmethod
+    def create_recipe(cls, number):
+        return Recipe.objects.create(
+            author=cls.author,
+            name=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+
+    def setUp(self):
+        self.index = PantryIndex()
+
+    def brute_force(self, ingredient_ids, max_missing=None):
+        recipes = {}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ):
+            recipes.setdefault(recipe_id, set()).add(ingredient_id)
+        matches = []
+        for recipe_id, recipe_ingredients in recipes.items():
+            found = len(recipe_ingredients & set(ingredient_ids))
+            missing = len(recipe_ingredients) - found
+            if found and (max_missing is None or missing <= max_missing):
+                matches.append((recipe_id, missing, found))
+        return sorted(matches, key=lambda match: (
+            match[1], -match[2] / (match[1] + match[2]), -match[0]
+        ))
+
+    def assertMatches(self, ingredient_ids, max_missing=None):
+        expected = self.brute_force(ingredient_ids, max_missing)
+        matches = self.index.match(ingredient_ids, max_missing)
+        self.assertEqual(len(matches), len(expected))
+        self.assertEqual(matches[0:len(matches)], expected)
+        for start in (0, 7, len(expected) - 3):
+            self.assertEqual(
+                matches[start:start + 10], expected[start:start + 10]
+            )
+
+    def queries(self):
+        ids = [ingredient.pk for ingredient in self.ingredients]
+        yield ids[:1], None
+        yield ids[12:], None
+        yield [*ids[:3], *ids[12:]], 1
+        yield ids[:4], None
+        yield ids[2:9], 2
+        yield ids, 0
+        for _ in range(10):
+            yield self.random.sample(ids, self.random.randint(1, 8)), (
+                self.random.choice([None, 0, 1, 3])
+            )
+
+    def test_matches_brute_force(self):
+        for ingredient_ids, max_missing in self.queries():
+            with self.subTest(ingredients=ingredient_ids, max=max_missing):
+                self.assertMatches(ingredient_ids, max_missing)
+
+    def test_all_found_ordered_by_newest(self):
+        ids = [ingredient.pk for ingredient in self.ingredients]
+        complete = [
+            recipe_id
+            for recipe_id, missing, _ in self.index.match(ids)[0:200]
+            if missing == 0
+        ]
+        self.assertEqual(complete, sorted(complete, reverse=True))
+
+    def test_postings(self):
+        self.index.match([self.ingredients[0].pk])
+        postings = self.index._state['postings']
+        self.assertIsInstance(postings[self.ingredients[0].pk], int)
+        for ingredient in self.rare:
+            self.assertIsInstance(postings[ingredient.pk], array)
+
+    def test_incremental_update(self):
+        self.index.match([self.ingredients[0].pk])
+        recipes = list(Recipe.objects.order_by('id'))
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].recipe_ingredients.filter(
+                ingredient=self.rare[0]
+            ).delete()
+            for recipe in recipes[:20]:
+                recipe.recipe_ingredients.filter(
+                    ingredient__in=self.ingredients[:2]
+                ).delete()
+                for ingredient in (self.ingredients[11], self.rare[1]):
+                    RecipeIngredient.objects.get_or_create(
+                        recipe=recipe,
+                        ingredient=ingredient,
+                        defaults={'amount': 1},
+                    )
+            recipes[20].recipe_ingredients.all().delete()
+            recipes[21].delete()
+            for number in range(3):
+                recipe = self.create_recipe(1000 + number)
+                for ingredient in self.ingredients[number:number + 3]:
+                    RecipeIngredient.objects.create(
+                        recipe=recipe, ingredient=ingredient, amount=1
+                    )
+        with mock.patch.object(
+            PantryIndex, '_build', side_effect=AssertionError
+        ):
+            for ingredient_ids, max_missing in self.queries():
+                with self.subTest(ingredients=ingredient_ids):
+                    self.assertMatches(ingredient_ids, max_missing)
@@ -1,19 +1,65 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 from foodgram.constants import (
     MAX_LENGTH_EMAIL,
+    MAX_LENGTH_FILE_NAME,
     MAX_LENGTH_USERNAME,
     MAX_LENGTH_FIRST_NAME,
     MAX_LENGTH_LAST_NAME,
 )
 
 
-class CustomUser(AbstractUser):
+class CounterFieldsMixin:
+    """Исключает поля-счётчики из обычного сохранения объекта.
+
+    Счётчики меняются только атомарными UPDATE с F-выражениями
+    (см. recipes.signals), поэтому save() уже загруженного объекта
+    не должен затирать их старыми значениями. Так же сохраняются поля,
+    которые пишут фоновые задачи.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUserQuerySet(models.QuerySet):
+    """QuerySet пользователей."""
+
+    def with_is_subscribed(self, user):
+        """Аннотирует подписку текущего пользователя на каждого автора."""
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_subscribed=models.Exists(Subscription.objects.filter(
+                user=user,
+                author=models.OuterRef('pk')
+            ))
+        )
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    """Менеджер пользователей."""
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     """Кастомная модель пользователя."""
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    counter_fields = (
+        'recipes_count',
+        'subscribers_count',
+        'avatar_variants_name',
+    )
 
     email = models.EmailField(
         'Электронная почта',
@@ -39,6 +85,24 @@ class CustomUser(AbstractUser):
         null=True,
         blank=True,
     )
+    avatar_variants_name = models.CharField(
+        'Аватар с построенными копиями',
+        max_length=MAX_LENGTH_FILE_NAME,
+        blank=True,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    objects = CustomUserManager()
 
     class Meta:
         ordering = ['username']